@@ -1,26 +1,23 @@
+import hashlib
 import os
 os.environ["STREAMLIT_FILE_WATCHER_TYPE"] = "none"
 
 import streamlit as st
 from dotenv import load_dotenv
-from file_loader import extract_text_from_pdf, extract_text_from_docx, extract_text_from_image
-from deidentification import deidentify_patient_info
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
+from file_loader import extract_text
+from deidentification import IncrementalDeidentifier
 from langchain_community.vectorstores import FAISS
-from langchain.schema import Document
-from langchain.chains import RetrievalQAWithSourcesChain
-from langchain_core.language_models.llms import LLM
-from pydantic import Field
-from typing import List
-from google.generativeai import GenerativeModel, configure
-import pickle
-from summarizer import summarize_medical_report
+from google.generativeai import configure
+from gemini_llm import build_gemini_llm
+from summarizer import RateLimiter, iter_summary_events
+from chunking import DEFAULT_CHUNK_TOKENS, chunk_report
+from llm_cache import LLMCache
+from vector_store import VectorIndexStore, document_key, update_index
+from embeddings import DEFAULT_EMBEDDING_MODEL, get_embedding_service
+from metrics import Metrics, track
+from qa import SemanticAnswerCache, answer_question, build_qa_chain
+from pdf_export import generate_pdf
 import logging
-from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -29,45 +26,30 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 load_dotenv()
 configure(api_key=os.getenv("GOOGLE_API_KEY")or st.secrets.get("GOOGLE_API_KEY"))
 
-# LLM Wrapper
-class GeminiLLMWrapper(LLM):
-    client: object = Field(...)
-
-    def _call(self, prompt: str, stop: List[str] = None) -> str:
-        response = self.client.generate_content(prompt)
-        return response.text
-
-    @property
-    def _llm_type(self) -> str:
-        return "google-gemini"
-
-# PDF Generator
-def generate_pdf(practitioner_summary, patient_summary):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-
-    if practitioner_summary:
-        elements.append(Paragraph("👨‍⚕️ Summary for Practitioner", styles['Heading2']))
-        elements.append(Spacer(1, 12))
-        for para in practitioner_summary.split('\n'):
-            if para.strip():
-                elements.append(Paragraph(para.strip(), styles['BodyText']))
-                elements.append(Spacer(1, 6))
-
-    if patient_summary:
-        elements.append(Spacer(1, 24))
-        elements.append(Paragraph("👤 Summary for Patient", styles['Heading2']))
-        elements.append(Spacer(1, 12))
-        for para in patient_summary.split('\n'):
-            if para.strip():
-                elements.append(Paragraph(para.strip(), styles['BodyText']))
-                elements.append(Spacer(1, 6))
-
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+# Shared LLM response cache, one SQLite connection per process
+@st.cache_resource
+def get_llm_cache():
+    return LLMCache()
+
+# One Gemini quota per API key, so one rate limiter for every rerun and session
+@st.cache_resource
+def get_rate_limiter():
+    return RateLimiter()
+
+# Shared on-disk FAISS index store, keyed by document content
+@st.cache_resource
+def get_vector_store():
+    return VectorIndexStore()
+
+# Embedding model, loaded once per process and shared by all sessions
+@st.cache_resource
+def get_embeddings():
+    return get_embedding_service(DEFAULT_EMBEDDING_MODEL)
+
+# Answers to earlier questions, shared by sessions looking at the same document
+@st.cache_resource
+def get_answer_cache():
+    return SemanticAnswerCache()
 
 # Streamlit UI setup
 st.set_page_config(page_title="Medical Report Summarizer", layout="wide")
@@ -98,26 +80,28 @@ with st.expander("ℹ️ What does this app do?", expanded=True):
 
 # Initialize state
 defaults = {
-    "deid_text": None, "final_text": None, "vector_index": None,
-    "chunks": None, "wrapped_llm": None,
+    "deid_text": None, "final_text": None, "vector_index": None, "index_base": None,
+    "chunks": None, "wrapped_llm": None, "qa_chain": None, "doc_key": None, "deidentifier": IncrementalDeidentifier(),
     "summary_practitioner": None, "summary_patient": None,
-    "show_extracted": True, "show_deid": False
+    "show_extracted": True, "show_deid": False,
+    "upload_id": None, "report_metrics": Metrics()
 }
 for k, v in defaults.items():
     if k not in st.session_state:
         st.session_state[k] = v
 
 # Upload
-uploaded_file = st.file_uploader("📤 Upload a medical report:", type=["pdf", "docx", "png", "jpg", "jpeg"])
-if uploaded_file:
-    ext = uploaded_file.name.lower()
-    with st.spinner("🔍 Extracting text..."):
-        if ext.endswith(".pdf"):
-            extracted_text = extract_text_from_pdf(uploaded_file)
-        elif ext.endswith(".docx"):
-            extracted_text = extract_text_from_docx(uploaded_file)
-        else:
-            extracted_text = extract_text_from_image(uploaded_file)
+uploaded_file = st.file_uploader("📤 Upload a medical report:", type=["pdf", "docx", "png", "jpg", "jpeg", "tif", "tiff"])
+# Only extract when a different file is uploaded, not on every rerun; compare content,
+# since a different report can have the same name and size
+upload_id = hashlib.sha256(uploaded_file.getvalue()).hexdigest() if uploaded_file else None
+if uploaded_file and st.session_state.upload_id != upload_id:
+    st.session_state.upload_id = upload_id
+    st.session_state.report_metrics = Metrics()
+    st.session_state.deidentifier = IncrementalDeidentifier()
+    st.session_state.index_base = None
+    with st.spinner("🔍 Extracting text..."), track(st.session_state.report_metrics):
+        extracted_text = extract_text(uploaded_file.name, uploaded_file.getvalue())
     st.session_state.extracted_text = extracted_text
     st.session_state.show_extracted = True
     st.session_state.show_deid = False
@@ -128,8 +112,9 @@ if "extracted_text" in st.session_state and st.session_state.extracted_text:
         edited_text = st.text_area("Edit extracted text:", value=st.session_state.extracted_text, height=400)
 
     if st.button("🔒 De-identify Text"):
-        with st.spinner("De-identifying..."):
-            st.session_state.deid_text = deidentify_patient_info(edited_text)
+        with st.spinner("De-identifying..."), track(st.session_state.report_metrics):
+            # Only paragraphs edited since the last run go through spaCy again
+            st.session_state.deid_text = st.session_state.deidentifier.deidentify(edited_text)
             st.session_state.final_text = st.session_state.deid_text
             st.session_state.vector_index = None
             st.session_state.chunks = None
@@ -145,44 +130,86 @@ if st.session_state.deid_text:
             "De-identified (editable):", value=st.session_state.deid_text, height=400
         )
 
+    derive_layman = st.checkbox(
+        "⚡ Faster: write the patient summary from the practitioner notes",
+        help="Skips a separate patient-language pass over every chunk, roughly halving the number of AI calls."
+    )
     if st.button("🧠 Summarize Report"):
-        with st.spinner("Summarizing report..."):
-            doc = Document(page_content=st.session_state.final_text)
-            splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            chunks = splitter.split_documents([doc])
-            for i, chunk in enumerate(chunks):
-                chunk.metadata["source"] = f"chunk-{i+1}"
-
-            embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-            vector_index = FAISS.from_documents(chunks, embeddings)
-
-            with open("vector_index.pkl", "wb") as f:
-                pickle.dump(vector_index, f)
-
-            gemini_model = GenerativeModel(
-                model_name="gemini-2.0-flash",
-                generation_config={"max_output_tokens": 512, "temperature": 0.5}
+        with st.spinner("Indexing report..."), track(st.session_state.report_metrics):
+            chunks = chunk_report(st.session_state.final_text)
+
+            embeddings = get_embeddings()
+            index_key = document_key(st.session_state.final_text, embeddings.model_name, chunking={"sections": DEFAULT_CHUNK_TOKENS})
+            # After an edit, keep the vectors of unchanged chunks and only embed the changed ones
+            index_base = st.session_state.index_base
+            vector_index = get_vector_store().get_or_build(
+                index_key, embeddings,
+                lambda: update_index(index_base, chunks, embeddings) if index_base else FAISS.from_documents(chunks, embeddings)
             )
-            wrapped_llm = GeminiLLMWrapper(client=gemini_model)
+
+            wrapped_llm = build_gemini_llm()
 
             st.session_state.vector_index = vector_index
+            st.session_state.index_base = vector_index
             st.session_state.chunks = chunks
             st.session_state.wrapped_llm = wrapped_llm
-
-            try:
-                st.session_state.summary_practitioner = summarize_medical_report("Medical Report", chunks, wrapped_llm, audience="practitioner")
-            except Exception as e:
-                st.session_state.summary_practitioner = f"❌ Practitioner summary failed: {e}"
-
-            try:
-                st.session_state.summary_patient = summarize_medical_report("Medical Report", chunks, wrapped_llm, audience="layman")
-            except Exception as e:
-                st.session_state.summary_patient = f"❌ Patient summary failed: {e}"
+            # Built once per document and reused for every question
+            st.session_state.qa_chain = build_qa_chain(wrapped_llm, vector_index)
+            st.session_state.doc_key = index_key
+
+        audience_labels = {"practitioner": "👨‍⚕️ Practitioner", "layman": "👤 Patient"}
+        total_calls = len(chunks) * (1 if derive_layman else 2)
+        progress = st.progress(0.0, text="Summarizing chunks...")
+        live = {audience: st.empty() for audience in audience_labels}
+        streamed = {audience: "" for audience in audience_labels}
+        done_calls = 0
+        try:
+            with track(st.session_state.report_metrics):
+                for event in iter_summary_events(
+                    "Medical Report", chunks, wrapped_llm, audiences=("practitioner", "layman"), derive_layman=derive_layman,
+                    rate_limiter=get_rate_limiter(), cache=get_llm_cache()
+                ):
+                    if event["type"] == "chunk":
+                        done_calls += 1
+                        progress.progress(min(done_calls / total_calls, 1.0), text=f"Summarized {done_calls}/{total_calls} chunk passes")
+                    elif event["type"] == "reduce":
+                        progress.progress(1.0, text=f"Condensing {audience_labels[event['audience']]} notes (level {event['level']})...")
+                    elif event["type"] == "token":
+                        audience = event["audience"]
+                        streamed[audience] += event["text"]
+                        live[audience].markdown(f"**{audience_labels[audience]} summary**\n\n{streamed[audience]}▌")
+                    elif event["type"] == "done":
+                        st.session_state.summary_practitioner = event["summaries"]["practitioner"]
+                        st.session_state.summary_patient = event["summaries"]["layman"]
+        except Exception as e:
+            st.session_state.summary_practitioner = f"❌ Practitioner summary failed: {e}"
+            st.session_state.summary_patient = f"❌ Patient summary failed: {e}"
+        progress.empty()
+        for placeholder in live.values():
+            placeholder.empty()
 
 # Step 3: Summaries
 if st.session_state.summary_practitioner or st.session_state.summary_patient:
     st.markdown("## 📋 Report Summaries")
 
+    cache_stats = get_llm_cache().stats()
+    st.caption(f"🗄️ AI response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses since the app started")
+
+    report_metrics = st.session_state.report_metrics.to_json()
+    if report_metrics["stages"]:
+        with st.expander("⏱️ Processing Time Breakdown"):
+            st.table([
+                {"Stage": name, "Calls": stats["calls"], "Wall (s)": round(stats["wall_seconds"], 2),
+                 "CPU (s)": round(stats["cpu_seconds"], 2), "Peak RSS growth (MB)": round(stats["rss_growth_bytes"] / 2**20)}
+                for name, stats in sorted(report_metrics["stages"].items(), key=lambda item: -item[1]["wall_seconds"])
+            ])
+            counters = report_metrics["counters"]
+            st.caption(
+                f"🤖 {counters.get('llm_calls', 0)} AI calls, {counters.get('llm_retries', 0)} retries, "
+                f"{counters.get('llm_cache_hits', 0)} cache hits, ~{counters.get('prompt_tokens', 0)} prompt / "
+                f"~{counters.get('response_tokens', 0)} response tokens"
+            )
+
     if st.session_state.summary_practitioner:
         with st.expander("👨‍⚕️ Summary for Practitioner"):
             st.write(st.session_state.summary_practitioner)
@@ -208,17 +235,17 @@ if st.session_state.summary_practitioner or st.session_state.summary_patient:
         st.download_button("📄 Download Selected Summaries as PDF", data=pdf_data, file_name="medical_summary.pdf", mime="application/pdf")
 
 # Step 4: Q&A
-if st.session_state.vector_index and st.session_state.wrapped_llm:
+if st.session_state.vector_index and st.session_state.qa_chain:
     st.markdown("## 💬 Ask Questions")
     user_query = st.text_input("Type a question about the report:")
     if user_query:
-        with st.spinner("Generating answer..."):
+        with st.spinner("Generating answer..."), track(st.session_state.report_metrics):
             try:
-                chain = RetrievalQAWithSourcesChain.from_llm(
-                    llm=st.session_state.wrapped_llm,
-                    retriever=st.session_state.vector_index.as_retriever()
+                answer = answer_question(
+                    st.session_state.qa_chain, user_query, st.session_state.doc_key, get_embeddings(), cache=get_answer_cache()
                 )
-                response = chain.invoke({"question": user_query})
-                st.write(response["answer"])
+                st.write(answer)
             except Exception as e:
                 st.error(f"❌ Failed to answer question: {e}")
+        answer_stats = get_answer_cache().stats()
+        st.caption(f"💬 Answer cache: {answer_stats['hits']} hits, {answer_stats['misses']} misses ({answer_stats['hit_rate']:.0%} hit rate)")
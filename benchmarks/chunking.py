@@ -0,0 +1,71 @@
+"""
+Compare the original fixed-size, overlapping splitter with section-aware,
+token-budget chunking: chunk counts, tokens sent, LLM calls and summarization
+time against the fake LLM under a rate limit.
+
+    python -m benchmarks.chunking --reports 5 --sections 12 --latency 0.3 --requests-per-minute 60
+"""
+import argparse
+import time
+
+from benchmarks.fake_llm import FakeLLM
+from benchmarks.synthetic import generate_reports
+from chunking import DEFAULT_CHUNK_TOKENS, chunk_report
+from summarizer import RateLimiter, build_chunk_prompt, estimate_tokens, summarize_medical_report
+
+
+def legacy_chunk_report(text):
+    """
+    The splitter the app used before section-aware chunking, kept as the baseline
+    """
+    from langchain.schema import Document
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    chunks = splitter.split_documents([Document(page_content=text)])
+    for i, chunk in enumerate(chunks):
+        chunk.metadata["source"] = f"chunk-{i+1}"
+    return chunks
+
+
+def run(name, chunker, reports, args):
+    llm = FakeLLM(latency=args.latency, jitter=args.jitter, seed=args.seed)
+    rate_limiter = RateLimiter(args.requests_per_minute, 10_000_000)
+    chunk_count = 0
+    prompt_tokens = 0
+    start = time.perf_counter()
+    for text in reports:
+        chunks = chunker(text)
+        chunk_count += len(chunks)
+        prompt_tokens += sum(estimate_tokens(build_chunk_prompt("Report", chunk.page_content)) for chunk in chunks)
+        summarize_medical_report("Report", chunks, llm, max_workers=args.max_workers, rate_limiter=rate_limiter)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<16}{chunk_count:>8}{prompt_tokens:>14,}{llm.calls:>8}{elapsed:>10.1f}s")
+    return chunk_count, llm.calls, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=5)
+    parser.add_argument("--sections", type=int, default=12, help="Sections per report (controls size)")
+    parser.add_argument("--sentences", type=int, default=8, help="Sentences per section")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_CHUNK_TOKENS, help="Tokens per section-aware chunk")
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake LLM latency per call, seconds")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--requests-per-minute", type=int, default=60)
+    parser.add_argument("--max-workers", type=int, default=4)
+    args = parser.parse_args()
+
+    reports = [text for text, _ in generate_reports(args.reports, seed=args.seed, sections=args.sections,
+                                                     sentences_per_section=args.sentences)]
+    print(f"Reports: {len(reports)}, {sum(map(len, reports)):,} characters, {args.requests_per_minute} requests/minute")
+    print(f"{'chunker':<16}{'chunks':>8}{'chunk tokens':>14}{'calls':>8}{'time':>11}")
+    _, legacy_calls, legacy_time = run("fixed 1000/200", legacy_chunk_report, reports, args)
+    _, section_calls, section_time = run(f"sections {args.token_budget}",
+                                         lambda text: chunk_report(text, args.token_budget), reports, args)
+    print(f"LLM calls: {legacy_calls / max(1, section_calls):.1f}x fewer, time: {legacy_time / max(section_time, 1e-9):.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
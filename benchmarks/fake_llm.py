@@ -0,0 +1,68 @@
+"""
+A deterministic stand-in for the Gemini wrapper, so summarization can be
+benchmarked offline with controlled latency and rate-limit errors.
+"""
+import hashlib
+import random
+import threading
+import time
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class FakeLLM:
+    """
+    Answers every prompt with a fixed-length digest of it after `latency`
+    seconds (plus up to `jitter`), and fails a `rate_limit_rate` fraction of
+    calls with a 429 error. All randomness comes from `seed`.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.05, rate_limit_rate=0.0, response_words=80, stream_pieces=8, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.response_words = response_words
+        self.stream_pieces = stream_pieces
+        self.calls = 0
+        self.rate_limited = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    @property
+    def _identifying_params(self):
+        return {"response_words": self.response_words}
+
+    def _start_call(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            limited = self._rng.random() < self.rate_limit_rate
+            if limited:
+                self.rate_limited += 1
+        if limited:
+            time.sleep(delay / 10)
+            raise RateLimitError("429 Resource has been exhausted (e.g. check quota).")
+        return delay
+
+    def _response(self, prompt):
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        words = [f"finding-{digest[(i * 2) % 64:(i * 2) % 64 + 4]}" for i in range(self.response_words)]
+        return " ".join(words)
+
+    def invoke(self, prompt):
+        time.sleep(self._start_call())
+        return self._response(prompt)
+
+    def stream(self, prompt):
+        delay = self._start_call()
+        words = self._response(prompt).split(" ")
+        size = max(1, len(words) // self.stream_pieces)
+        for start in range(0, len(words), size):
+            time.sleep(delay / self.stream_pieces)
+            yield " ".join(words[start:start + size]) + " "
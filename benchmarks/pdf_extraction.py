@@ -0,0 +1,66 @@
+"""
+Time PDF text extraction for text-layer, scanned and mixed documents, with
+scanned pages OCR'd in the calling process (--workers 1) or in the shared
+worker pool. The first run in each row includes starting the pool.
+
+    python -m benchmarks.pdf_extraction --text-pages 60 --scanned-pages 6 --workers 4
+"""
+import argparse
+import time
+
+import fitz  # pymupdf
+
+from benchmarks.synthetic import generate_reports
+from file_loader import extract_pdf_pages
+
+
+def build_pdf(text_pages, scanned_pages, seed=0):
+    """
+    A PDF with `text_pages` pages that have a text layer followed by
+    `scanned_pages` pages that are only an image of text
+    """
+    reports = generate_reports(text_pages + scanned_pages, seed=seed, sections=3, sentences_per_section=4)
+    doc = fitz.open()
+    for i, (text, _) in enumerate(reports):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(54, 54, 558, 738), text, fontsize=9)
+        if i >= text_pages:
+            # Replace the page with a 150 dpi picture of itself, like a fax scan
+            pixmap = page.get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+            doc.delete_page(-1)
+            doc.new_page().insert_image(fitz.Rect(0, 0, 612, 792), pixmap=pixmap)
+    return doc.tobytes()
+
+
+def run(name, data, workers, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pages = extract_pdf_pages(data, max_workers=workers)
+        timings.append(time.perf_counter() - start)
+    warm = min(timings[1:]) if repeat > 1 else timings[0]
+    print(f"{name:<22}{workers:>8}{len(pages):>7}{timings[0] * 1000:>12.0f}{warm * 1000:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--text-pages", type=int, default=60)
+    parser.add_argument("--scanned-pages", type=int, default=6)
+    parser.add_argument("--workers", type=int, default=4, help="OCR worker processes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    documents = {
+        "text layer": build_pdf(args.text_pages, 0, args.seed),
+        "scanned": build_pdf(0, args.scanned_pages, args.seed),
+        "mixed": build_pdf(args.text_pages, args.scanned_pages, args.seed),
+    }
+    print(f"{'document':<22}{'workers':>8}{'pages':>7}{'first ms':>12}{'warm ms':>11}")
+    for name, data in documents.items():
+        for workers in sorted({1, args.workers}):
+            run(name, data, workers, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
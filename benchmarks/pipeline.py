@@ -0,0 +1,213 @@
+"""
+End-to-end offline benchmark: synthetic reports with seeded PHI go through
+de-identification, chunking, embedding, FAISS build and summarization against
+a fake LLM. Reports per-stage throughput, latency percentiles and peak memory,
+and PHI recall, which can be checked against a saved baseline.
+
+    python -m benchmarks.pipeline --reports 20 --sections 8 --latency 0.2 --rate-limit-rate 0.05
+    python -m benchmarks.pipeline --save-baseline benchmarks/phi_baseline.json
+    python -m benchmarks.pipeline --baseline benchmarks/phi_baseline.json   # exits 1 if recall dropped
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+from benchmarks.fake_llm import FakeLLM
+from benchmarks.synthetic import generate_reports
+
+STAGES = ("deidentify", "chunk", "embed", "index", "summarize")
+# Stages whose output another stage reads
+PREREQUISITES = {"embed": ("chunk",), "index": ("embed",), "summarize": ("chunk",)}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def with_prerequisites(stages):
+    """
+    Add the stages that `stages` depend on, in pipeline order
+    """
+    needed = set()
+    pending = list(stages)
+    while pending:
+        name = pending.pop()
+        if name not in needed:
+            needed.add(name)
+            pending.extend(PREREQUISITES.get(name, ()))
+    return [name for name in STAGES if name in needed]
+
+
+def build_stages(args):
+    """
+    Return {stage: fn(state)} where each fn reads and extends a per-report dict
+    """
+    from chunking import chunk_report
+    from deidentification import deidentify_patient_info
+    from summarizer import RateLimiter, summarize_medical_report
+
+    llm = FakeLLM(latency=args.latency, jitter=args.jitter, rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+    rate_limiter = RateLimiter(args.requests_per_minute, 10_000_000)
+    stages = {}
+
+    def deidentify(state):
+        state["deidentified"] = deidentify_patient_info(state["text"])
+
+    def chunk(state):
+        state["chunks"] = chunk_report(state.get("deidentified", state["text"]))
+
+    stages["deidentify"] = deidentify
+    stages["chunk"] = chunk
+
+    if "embed" in args.stages or "index" in args.stages:
+        from embeddings import get_embedding_service
+
+        embeddings = get_embedding_service()
+
+        def embed(state):
+            state["vectors"] = embeddings.embed_documents([c.page_content for c in state["chunks"]])
+
+        def index(state):
+            from langchain_community.vectorstores import FAISS
+
+            pairs = [(c.page_content, v) for c, v in zip(state["chunks"], state["vectors"])]
+            state["index"] = FAISS.from_embeddings(pairs, embeddings, metadatas=[c.metadata for c in state["chunks"]])
+
+        stages["embed"] = embed
+        stages["index"] = index
+
+    def summarize(state):
+        state["summary"] = summarize_medical_report(
+            "Synthetic Report", state["chunks"], llm, max_workers=args.max_workers, rate_limiter=rate_limiter
+        )
+
+    stages["summarize"] = summarize
+    return {name: fn for name, fn in stages.items() if name in args.stages}, llm
+
+
+def run_stages(stages, report_text):
+    state = {"text": report_text}
+    timings = {}
+    for name, fn in stages.items():
+        start = time.perf_counter()
+        fn(state)
+        timings[name] = time.perf_counter() - start
+    return state, timings
+
+
+def measure_memory(stages, report_text):
+    # A separate pass, since tracing allocations slows everything down
+    state = {"text": report_text}
+    peaks = {}
+    tracemalloc.start()
+    for name, fn in stages.items():
+        tracemalloc.reset_peak()
+        fn(state)
+        peaks[name] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peaks
+
+
+def phi_recall(reports, outputs):
+    found = Counter()
+    removed = Counter()
+    for (_, phi), output in zip(reports, outputs):
+        for kind, value in phi:
+            found[kind] += 1
+            removed[kind] += value not in output
+    by_type = {kind: removed[kind] / found[kind] for kind in sorted(found)}
+    overall = sum(removed.values()) / max(1, sum(found.values()))
+    return overall, by_type
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=20, help="Number of synthetic reports")
+    parser.add_argument("--sections", type=int, default=5, help="Sections per report (controls size)")
+    parser.add_argument("--sentences", type=int, default=6, help="Sentences per section")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake LLM latency per call, seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Extra random latency per call, seconds")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of calls failing with 429")
+    parser.add_argument("--requests-per-minute", type=int, default=6000)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--json-out", help="Write the full results as JSON")
+    parser.add_argument("--save-baseline", help="Write PHI recall per type to this file")
+    parser.add_argument("--baseline", help="Fail if PHI recall drops below this saved baseline")
+    args = parser.parse_args()
+
+    reports = generate_reports(args.reports, seed=args.seed, sections=args.sections,
+                               sentences_per_section=args.sentences)
+    total_chars = sum(len(text) for text, _ in reports)
+    print(f"Reports: {len(reports)}, {total_chars:,} characters, seed {args.seed}")
+
+    # Prerequisites of the requested stages run too, but are left out of the report
+    requested = args.stages
+    args.stages = with_prerequisites(requested)
+    stages, llm = build_stages(args)
+    # Warm up model loading so it is not charged to the first report
+    run_stages(stages, reports[0][0])
+    llm.calls = llm.rate_limited = 0
+
+    latencies = {name: [] for name in stages if name in requested}
+    outputs = []
+    for text, _ in reports:
+        state, timings = run_stages(stages, text)
+        outputs.append(state.get("deidentified", text))
+        for name in latencies:
+            latencies[name].append(timings[name])
+    peaks = measure_memory(stages, reports[0][0])
+
+    results = {"reports": len(reports), "characters": total_chars, "stages": {}, "llm": {
+        "calls": llm.calls, "rate_limited": llm.rate_limited}}
+    print(f"{'stage':<12}{'reports/s':>11}{'kchars/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+    for name, timings in latencies.items():
+        total = sum(timings)
+        row = {
+            "reports_per_second": len(timings) / total if total else float("inf"),
+            "chars_per_second": total_chars / total if total else float("inf"),
+            "p50_seconds": percentile(timings, 50),
+            "p95_seconds": percentile(timings, 95),
+            "p99_seconds": percentile(timings, 99),
+            "peak_bytes": peaks[name],
+        }
+        results["stages"][name] = row
+        print(f"{name:<12}{row['reports_per_second']:>11.2f}{row['chars_per_second'] / 1000:>10.1f}"
+              f"{row['p50_seconds'] * 1000:>10.1f}{row['p95_seconds'] * 1000:>10.1f}{row['p99_seconds'] * 1000:>10.1f}"
+              f"{row['peak_bytes'] / 2**20:>10.1f}")
+    print(f"fake LLM: {llm.calls} calls, {llm.rate_limited} rate-limited")
+
+    exit_code = 0
+    if "deidentify" in latencies:
+        overall, by_type = phi_recall(reports, outputs)
+        results["phi_recall"] = {"overall": overall, "by_type": by_type}
+        print(f"PHI recall: {overall:.1%}  " + "  ".join(f"{kind}={value:.0%}" for kind, value in by_type.items()))
+
+        if args.save_baseline:
+            with open(args.save_baseline, "w", encoding="utf-8") as f:
+                json.dump(results["phi_recall"], f, indent=2)
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+            regressions = {kind: (baseline["by_type"][kind], value) for kind, value in by_type.items()
+                           if kind in baseline["by_type"] and value < baseline["by_type"][kind]}
+            if overall < baseline["overall"] or regressions:
+                print(f"PHI recall regressed: overall {baseline['overall']:.1%} -> {overall:.1%}; "
+                      + ", ".join(f"{kind} {old:.0%} -> {new:.0%}" for kind, (old, new) in regressions.items()))
+                exit_code = 1
+            else:
+                print("PHI recall: no regression against baseline")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare startup and per-document latency of the full spaCy pipeline against
+the lazily loaded, NER-only pipeline used for de-identification.
+
+    python -m benchmarks.spacy_pipeline --model en_core_web_lg --docs 50
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.deidentify import build_report
+from deidentification import DEFAULT_SPACY_MODEL, load_ner_pipeline
+
+
+def import_time(module):
+    # Measured in a fresh interpreter so nothing is already cached
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    return float(subprocess.check_output([sys.executable, "-c", code], text=True).strip())
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def per_doc_latency(nlp, docs):
+    nlp(docs[0])  # warm up
+    timings = [timed(nlp, doc)[0] for doc in docs]
+    timings.sort()
+    return statistics.mean(timings), timings[len(timings) // 2], timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=DEFAULT_SPACY_MODEL, help="spaCy model name or path")
+    parser.add_argument("--docs", type=int, default=50, help="Documents to time")
+    parser.add_argument("--pages", type=int, default=2, help="Pages per document")
+    args = parser.parse_args()
+
+    print(f"import deidentification  : {import_time('deidentification'):8.3f}s")
+
+    import spacy
+
+    full_load, full_nlp = timed(spacy.load, args.model)
+    ner_load, ner_nlp = timed(load_ner_pipeline, args.model)
+    print(f"load full pipeline       : {full_load:8.3f}s  {full_nlp.pipe_names}")
+    print(f"load NER-only pipeline   : {ner_load:8.3f}s  {ner_nlp.pipe_names}")
+
+    docs = [build_report(args.pages) for _ in range(args.docs)]
+    for label, nlp in (("full pipeline", full_nlp), ("NER-only pipeline", ner_nlp)):
+        mean, p50, p95 = per_doc_latency(nlp, docs)
+        print(f"{label:<25}: mean {mean * 1000:7.1f}ms  p50 {p50 * 1000:7.1f}ms  p95 {p95 * 1000:7.1f}ms")
+
+    same = all(
+        [(e.text, e.label_) for e in full_nlp(doc).ents] == [(e.text, e.label_) for e in ner_nlp(doc).ents]
+        for doc in docs[:5]
+    )
+    print(f"identical entities       : {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Synthetic medical reports with seeded PHI, for benchmarks that must run offline.
+
+Every report is generated from a seeded random.Random, so the same seed always
+gives the same text, and the PHI values planted in it are returned alongside so
+that de-identification recall can be measured.
+"""
+import random
+
+FIRST_NAMES = ["James", "Mary", "Robert", "Patricia", "Michael", "Linda", "David", "Elizabeth", "Chinedu", "Aisha",
+               "Oluwaseun", "Ngozi", "Thomas", "Sarah", "Daniel", "Grace"]
+LAST_NAMES = ["Johnson", "Williams", "Brown", "Garcia", "Miller", "Okafor", "Adeyemi", "Wilson", "Anderson",
+              "Taylor", "Balogun", "Thompson", "Martinez", "Clarke"]
+CITIES = ["Springfield", "Chicago", "Boston", "Lagos", "Abuja", "Denver", "Seattle", "Houston"]
+STREETS = ["Oak Street", "Maple Avenue", "Cedar Road", "Park Lane", "Hill Drive", "Lake Boulevard"]
+FACILITY_NAMES = ["St. Mary", "Riverside", "Mercy General", "Northside", "Unity", "Grace Memorial"]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October",
+          "November", "December"]
+
+CLINICAL_SENTENCES = [
+    "The patient reports intermittent chest discomfort on exertion, relieved by rest.",
+    "Blood pressure remains elevated despite adherence to amlodipine 10 mg daily.",
+    "Renal function is within normal limits and electrolytes are unremarkable.",
+    "Chest radiograph shows no acute cardiopulmonary process.",
+    "Echocardiogram demonstrates mild concentric left ventricular hypertrophy with preserved ejection fraction.",
+    "HbA1c has improved compared with the previous review and fasting glucose is stable.",
+    "There is mild tenderness in the right lower quadrant without guarding or rebound.",
+    "Full blood count shows a mild normocytic anaemia; iron studies are pending.",
+    "The wound is healing well with no signs of infection.",
+    "Lisinopril 5 mg was added and home blood pressure monitoring was advised.",
+    "Lungs are clear to auscultation bilaterally with no added sounds.",
+    "The patient was counselled on diet, exercise and smoking cessation.",
+]
+SECTION_TITLES = ["HISTORY OF PRESENTING ILLNESS", "EXAMINATION", "INVESTIGATIONS", "ASSESSMENT", "PLAN"]
+
+
+def _phone(rng):
+    return f"({rng.randint(200, 989)}) {rng.randint(200, 989)}-{rng.randint(1000, 9999)}"
+
+
+def _date(rng):
+    return f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(1940, 2005)}"
+
+
+def generate_report(rng, sections=5, sentences_per_section=6):
+    """
+    Return (text, phi) for one report; `phi` is a list of (type, value) pairs
+    that appear verbatim in the text and should not survive de-identification
+    """
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    doctor = rng.choice(LAST_NAMES)
+    facility = f"{rng.choice(FACILITY_NAMES)} Hospital"
+    phi = [
+        ("PERSON", f"{first} {last}"),
+        ("DATE", _date(rng)),
+        ("MRN", str(rng.randint(1_000_000, 9_999_999))),
+        ("PHONE", _phone(rng)),
+        ("EMAIL", f"{first.lower()}.{last.lower()}@example.com"),
+        ("ADDRESS", f"{rng.randint(10, 9999)} {rng.choice(STREETS)}"),
+        ("LOCATION", rng.choice(CITIES)),
+        ("PHYSICIAN", f"Dr. {doctor}"),
+        ("HOSPITAL", facility),
+        ("AGE", f"{rng.randint(18, 95)}-year-old"),
+    ]
+    values = dict(phi)
+    visit = f"{rng.choice(MONTHS)} {rng.randint(1, 28)}, {rng.randint(2015, 2024)}"
+    phi.append(("DATE", visit))
+
+    lines = [
+        "CLINICAL REPORT",
+        f"Patient: {values['PERSON']}    DOB: {values['DATE']}    MRN: {values['MRN']}",
+        f"Address: {values['ADDRESS']}, {values['LOCATION']}",
+        f"Phone: {values['PHONE']}    Email: {values['EMAIL']}",
+        f"Seen by {values['PHYSICIAN']} at {values['HOSPITAL']} on {visit}.",
+        "",
+    ]
+    for s in range(sections):
+        lines.append(SECTION_TITLES[s % len(SECTION_TITLES)])
+        body = [rng.choice(CLINICAL_SENTENCES) for _ in range(sentences_per_section)]
+        if s == 0:
+            body.insert(0, f"{values['PERSON']} is a {values['AGE']} patient from {values['LOCATION']}.")
+        lines.append(" ".join(body))
+        lines.append("")
+    return "\n".join(lines), phi
+
+
+def generate_reports(count, seed=0, sections=5, sentences_per_section=6):
+    rng = random.Random(seed)
+    return [generate_report(rng, sections, sentences_per_section) for _ in range(count)]
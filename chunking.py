@@ -0,0 +1,100 @@
+import re
+
+from summarizer import estimate_tokens
+
+# Estimated model tokens per chunk; each chunk becomes one summarization call
+DEFAULT_CHUNK_TOKENS = 1500
+
+_HEADING_WORDS = (
+    "chief complaint", "presenting complaint", "history", "clinical history", "clinical information",
+    "indication", "technique", "comparison", "findings", "impression", "conclusion", "assessment",
+    "plan", "diagnosis", "diagnoses", "examination", "physical exam", "investigations", "results",
+    "labs", "laboratory results", "vital signs", "vitals", "medications", "allergies", "procedure",
+    "recommendations", "summary", "discharge", "course", "hospital course", "follow up", "follow-up",
+    "review of systems", "social history", "family history", "past medical history",
+)
+
+# A section starts at a line that is an all-caps heading ("FINDINGS", "HISTORY OF PRESENTING
+# ILLNESS:") or begins with a known heading followed by a colon ("Impression: stable")
+_SECTION_START = re.compile(
+    r"^(?=[ \t]*(?:"
+    r"[A-Z][A-Z &/(),'-]{2,60}[ \t]*:?[ \t]*$"
+    rf"|(?i:{'|'.join(re.escape(word) for word in _HEADING_WORDS)})\b[A-Za-z &/-]{{0,40}}:"
+    r"))",
+    re.MULTILINE,
+)
+
+# Progressively finer ways to break a section that alone exceeds the budget
+_SPLIT_LEVELS = (
+    re.compile(r".*?(?:\n[ \t]*\n\s*|$)", re.DOTALL),  # paragraphs
+    re.compile(r".*?(?:\n|$)", re.DOTALL),  # lines
+    re.compile(r".*?(?:[.!?](?:\s+|$)|$)", re.DOTALL),  # sentences
+    re.compile(r"\S*\s*"),  # words
+)
+
+
+def split_sections(text):
+    """
+    Split text at page breaks (form feeds) and section headings, returning
+    (heading, section_text) pairs that join back to the original text
+    """
+    starts = {0}
+    starts.update(match.start() for match in _SECTION_START.finditer(text))
+    starts.update(match.end() for match in re.finditer(r"\f", text))
+    bounds = sorted(start for start in starts if start < len(text)) + [len(text)]
+
+    sections = []
+    for start, end in zip(bounds, bounds[1:]):
+        section = text[start:end]
+        first_line = section.lstrip("\f \t\n").split("\n", 1)[0]
+        heading = first_line.split(":", 1)[0].strip() if _SECTION_START.match(section.lstrip("\f")) else None
+        sections.append((heading, section))
+    return sections
+
+
+def _split_oversized(text, token_budget, level=0):
+    if level == len(_SPLIT_LEVELS) or estimate_tokens(text) <= token_budget:
+        yield text
+        return
+    for match in _SPLIT_LEVELS[level].finditer(text):
+        if match.group(0):
+            yield from _split_oversized(match.group(0), token_budget, level + 1)
+
+
+def chunk_report(text, token_budget=DEFAULT_CHUNK_TOKENS):
+    """
+    Split report text into LangChain documents tagged chunk-1, chunk-2, ...
+
+    Whole sections (and pages) are packed together up to `token_budget`
+    estimated tokens, so related content stays in one chunk and short sections
+    do not each cost an LLM call. A section over the budget is broken on
+    paragraphs, then lines, sentences and words. Chunks do not overlap. Each
+    chunk's metadata lists the section headings it contains.
+    """
+    from langchain.schema import Document
+
+    chunks = []
+    parts, headings, size = [], [], 0
+
+    def flush():
+        content = "".join(parts).strip()
+        if content:
+            chunks.append(Document(
+                page_content=content,
+                metadata={"source": f"chunk-{len(chunks) + 1}", "sections": list(dict.fromkeys(headings))},
+            ))
+        parts.clear()
+        headings.clear()
+
+    for heading, section in split_sections(text):
+        for piece in _split_oversized(section, token_budget):
+            tokens = estimate_tokens(piece)
+            if parts and size + tokens > token_budget:
+                flush()
+                size = 0
+            parts.append(piece)
+            size += tokens
+            if heading:
+                headings.append(heading)
+    flush()
+    return chunks
@@ -1,202 +1,575 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
 import re
-import spacy
+import sys
+from collections import deque
+from itertools import islice, tee
+from typing import NamedTuple
 
-nlp = spacy.load("en_core_web_lg")
+import metrics
 
-def deidentify_patient_info(text):
-    if not text or not isinstance(text, str):
-        return text
+DEFAULT_SPACY_MODEL = "en_core_web_lg"
+
+# Components that never contribute to doc.ents
+_NON_NER_COMPONENTS = ["tagger", "parser", "attribute_ruler", "lemmatizer", "senter", "morphologizer"]
+
+_nlp = None
+_spacy_model = None
+
+
+def load_ner_pipeline(model):
     """
-    Remove patient identifying information from medical text
+    Load `model` with only the components needed to produce doc.ents
     """
-    if not text or not isinstance(text, str):
-        return text
-    
-    # Make a copy of the original text that we'll modify
-    deidentified_text = text
-
-    # 1. Replace names and person entities
-    doc = nlp(text)
-    
-    # Track all replacements to ensure consistency
-    replacements = {}
-    
-    # Process named entities
-    for ent in doc.ents:
-        # Handle person names
-        if ent.label_ == "PERSON":
-            if ent.text not in replacements:
-                replacements[ent.text] = "[PERSON]"
-            deidentified_text = deidentified_text.replace(ent.text, replacements[ent.text])
-        
-        # Handle ages
-        elif ent.label_ == "DATE" and re.search(r'\b\d{1,2}[ -]*(years?|yrs?).{0,10}(old|age)\b', ent.text, re.IGNORECASE):
-            deidentified_text = deidentified_text.replace(ent.text, "[AGE]")
-        
-        # Handle locations (addresses, cities)
-        elif ent.label_ in ["GPE", "LOC"]:
-            if ent.text not in replacements:
-                replacements[ent.text] = "[LOCATION]"
-            deidentified_text = deidentified_text.replace(ent.text, replacements[ent.text])
-    
-    # 2. Replace specific patterns
-
-    # Replace age patterns like "51-year-old", "30 yrs old", etc.
-    age_patterns = [
-        r'\b\d{1,3}[-\s]?(year[-\s]?old|yrs?[-\s]?old|years?[-\s]?of[-\s]?age)\b',  # 51-year-old
-        r'\b\d{1,3}\s*(?:y/?o|yo|y\.o\.)\b',  # 37 y/o, 37yo, 37 y.o.
-        r'\bage[d\s:]*?(\d{1,3})\b',  # aged 45, age: 45
-        r'\b(\d{1,3})[-\s]?years?\b'  # 37 years
-    ]
-    
-    for pattern in age_patterns:
-        deidentified_text = re.sub(pattern, '[AGE]', deidentified_text, flags=re.IGNORECASE)
-    
-    deidentified_text = re.sub(r'\b\d{1,3}\s*[yY]\b', '[AGE]', deidentified_text)
-
-    #  Replace case numbers
-    deidentified_text = re.sub(r'\b(?:Case\s+(?:No|Number|#)?[:.\s-]?\s*[A-Z0-9][-A-Z0-9]*)\b', '[CASE_NUMBER]', deidentified_text, flags=re.IGNORECASE)
-        
+    # Imported here so importing this module (and app.py) does not pay for spaCy
+    import spacy
+
+    nlp = spacy.load(model, exclude=_NON_NER_COMPONENTS)
+    # Shared embedding layers are only worth running if the NER listens to them
+    for name in ("tok2vec", "transformer"):
+        if name in nlp.pipe_names and "ner" not in getattr(nlp.get_pipe(name), "listening_components", []):
+            nlp.remove_pipe(name)
+    return nlp
+
+
+def get_nlp():
+    """
+    Return the NER pipeline, loading it on first use. The model is the one given to
+    set_spacy_model(), else $SPACY_MODEL, else en_core_web_lg; a package name
+    (en_core_web_sm/md/lg) or a path to a trained pipeline both work.
+    """
+    global _nlp
+    if _nlp is None:
+        model = _spacy_model or os.getenv("SPACY_MODEL") or DEFAULT_SPACY_MODEL
+        logging.info(f"Loading spaCy model {model}")
+        with metrics.stage("spacy_load"):
+            _nlp = load_ner_pipeline(model)
+    return _nlp
+
+
+def set_spacy_model(model):
+    """
+    Switch to a different spaCy model; it is loaded on next use
+    """
+    global _spacy_model, _nlp
+    _spacy_model = model
+    _nlp = None
+
+
+def _init_worker(model):
+    # Spawned workers start without the parent's set_spacy_model() choice; forked ones keep its loaded model
+    if model != _spacy_model:
+        set_spacy_model(model)
+
+
+# Month names shared by the date and year rules, factored by prefix so the
+# regex engine does not retry every full name at each position
+_MONTHS = r'(?:Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)'
+_MONTH_PREFIXES = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+
+# Anchors for rules whose matches always begin with a digit (or a phone prefix)
+_DIGIT = re.compile(r'\d')
+_PHONE_START = re.compile(r'[\d+(]')
+
+# Age check applied to spaCy DATE entities
+_ENTITY_AGE_PATTERN = re.compile(r'\b\d{1,2}[ -]*(years?|yrs?).{0,10}(old|age)\b', re.IGNORECASE)
+
+
+class RedactionRule(NamedTuple):
+    pattern: str
+    replacement: str
+    flags: int = 0
+    # Lowercase substrings, at least one of which occurs in every match
+    hints: tuple = ()
+    # Where every match starts: lowercase prefixes, or a regex whose matches mark the offsets
+    anchors: object = ()
+
+
+# Redaction rules in priority order. When two matches overlap, the rule listed
+# first wins, which mirrors the order the substitutions used to be applied in.
+# Hints and anchors only skip work; they never change what a rule matches.
+REDACTION_RULES = [
+    # Age patterns like "51-year-old", "30 yrs old", "37 y/o", "aged 45"
+    RedactionRule(r'\b\d{1,3}[-\s]?(year[-\s]?old|yrs?[-\s]?old|years?[-\s]?of[-\s]?age)\b', '[AGE]', re.IGNORECASE, hints=('year', 'yr'), anchors=_DIGIT),
+    RedactionRule(r'\b\d{1,3}\s*(?:y/?o|yo|y\.o\.)\b', '[AGE]', re.IGNORECASE, hints=('y',), anchors=_DIGIT),
+    RedactionRule(r'\bage[d\s:]*?(\d{1,3})\b', '[AGE]', re.IGNORECASE, anchors=('age',)),
+    RedactionRule(r'\b(\d{1,3})[-\s]?years?\b', '[AGE]', re.IGNORECASE, hints=('year',), anchors=_DIGIT),
+    RedactionRule(r'\b\d{1,3}\s*[yY]\b', '[AGE]', hints=('y',), anchors=_DIGIT),
+
+    # Case numbers
+    RedactionRule(r'\b(?:Case\s+(?:No|Number|#)?[:.\s-]?\s*[A-Z0-9][-A-Z0-9]*)\b', '[CASE_NUMBER]', re.IGNORECASE, anchors=('case',)),
+
     # Social Security Numbers (XXX-XX-XXXX or XXX XX XXXX)
-    deidentified_text = re.sub(r'\b\d{3}[-\s]?\d{2}[-\s]?\d{4}\b', '[SSN]', deidentified_text)
-    
+    RedactionRule(r'\b\d{3}[-\s]?\d{2}[-\s]?\d{4}\b', '[SSN]', anchors=_DIGIT),
+
     # Phone numbers (various formats)
-    deidentified_text = re.sub(r'\b(\+\d{1,2}\s)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}\b', '[PHONE]', deidentified_text)
-    deidentified_text = re.sub(r'\b0\d{10}\b', '[PHONE]', deidentified_text)
-    deidentified_text = re.sub(r'\b0\d{3,5}[A-Z]+\s*\(\d{10}\)', '[PHONE]', deidentified_text, flags=re.IGNORECASE)
-    deidentified_text = re.sub(r'\b0\d{3,5}[A-Z]+\s*\(\d{10}\)', '[PHONE]', deidentified_text, flags=re.IGNORECASE)
-    
+    RedactionRule(r'\b(\+\d{1,2}\s)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}\b', '[PHONE]', anchors=_PHONE_START),
+    RedactionRule(r'\b0\d{10}\b', '[PHONE]', anchors=('0',)),
+    RedactionRule(r'\b0\d{3,5}[A-Z]+\s*\(\d{10}\)', '[PHONE]', re.IGNORECASE, hints=('(',), anchors=('0',)),
+
     # Email addresses
-    deidentified_text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '[EMAIL]', deidentified_text)
-    
+    RedactionRule(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '[EMAIL]', hints=('@',)),
+
     # Medical record numbers (various formats)
-    deidentified_text = re.sub(r'\b(MRN|Medical Record Number|Record Number|Record #|#)[:.\s]?\s*\d+\b', '[MRN]', deidentified_text)
-    
-    # Enhanced date patterns with additional formats
-    date_patterns = [
-        # DOB explicit formats
-        r'\b(?:DOB|Date of Birth|Birth Date|Born on)[:.\s]?\s*\d{1,2}[-/]\d{1,2}[-/]\d{2,4}\b',
-        r'\b(?:DOB|Date of Birth|Birth Date|Born on)[:.\s]?\s*\w+ \d{1,2},? \d{2,4}\b',
-        
-        # Date formats - be thorough to catch numeric dates
-        r'\b\d{1,2}[-/]\d{1,2}[-/]\d{2,4}\b',  # 11/06/08, 06/15/1972
-        r'\b\d{2}[-/]\d{2}[-/]\d{2}\b',        # Special case for dates like 11/06/08
-        
-        # Month name formats
-        r'\b(?:January|February|March|April|May|June|July|August|September|October|November|December|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[.,]?\s+\d{1,2}(?:st|nd|rd|th)?[.,]?\s*\d{2,4}\b',
-        
-        # Stand-alone months with days
-        r'\b(?:January|February|March|April|May|June|July|August|September|October|November|December|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[.,]?\s+\d{1,2}(?:st|nd|rd|th)?\b',
-    ]
-    
-    for pattern in date_patterns:
-        deidentified_text = re.sub(pattern, '[DATE]', deidentified_text, flags=re.IGNORECASE)
-    
-    # Height measurements - FIXED to completely capture including quote marks
-    # Format for height entries (e.g., "Height: 5'10"" or "5 ft 10 in")
-    deidentified_text = re.sub(r'\b(height|ht)[:.]\s*\d+\s*(?:\'|feet|ft|foot)?\s*\d*\s*(?:\"|inches|in|″)?', '[HEIGHT]', deidentified_text, flags=re.IGNORECASE)
-    
-    # Standalone height measurements
-    deidentified_text = re.sub(r'\b\d+\s*(?:\'|feet|ft|foot)\s*\d*\s*(?:\"|inches|in|″)?', '[HEIGHT]', deidentified_text, flags=re.IGNORECASE)
-    
-    # Handle weight more precisely
-    deidentified_text = re.sub(r'\b(weight|wt)[:.]\s*\d+\.?\d*\s*(kg|kilos|lb|lbs|pounds)\b', '[WEIGHT]', deidentified_text, flags=re.IGNORECASE)
-    deidentified_text = re.sub(r'\b\d+\.?\d*\s*(kg|kilos|lb|lbs|pounds)\b', '[WEIGHT]', deidentified_text, flags=re.IGNORECASE)
-    
+    RedactionRule(r'\b(MRN|Medical Record Number|Record Number|Record #|#)[:.\s]?\s*\d+\b', '[MRN]', anchors=('mrn', 'medical record number', 'record number', 'record #', '#')),
+
+    # DOB explicit formats
+    RedactionRule(r'\b(?:DOB|Date of Birth|Birth Date|Born on)[:.\s]?\s*\d{1,2}[-/]\d{1,2}[-/]\d{2,4}\b', '[DATE]', re.IGNORECASE, anchors=('dob', 'date of birth', 'birth date', 'born on')),
+    RedactionRule(r'\b(?:DOB|Date of Birth|Birth Date|Born on)[:.\s]?\s*\w+ \d{1,2},? \d{2,4}\b', '[DATE]', re.IGNORECASE, anchors=('dob', 'date of birth', 'birth date', 'born on')),
+    # Numeric dates like 11/06/08, 06/15/1972
+    RedactionRule(r'\b\d{1,2}[-/]\d{1,2}[-/]\d{2,4}\b', '[DATE]', re.IGNORECASE, anchors=_DIGIT),
+    # Month name formats, with and without a year
+    RedactionRule(rf'\b{_MONTHS}[.,]?\s+\d{{1,2}}(?:st|nd|rd|th)?[.,]?\s*\d{{2,4}}\b', '[DATE]', re.IGNORECASE, anchors=_MONTH_PREFIXES),
+    RedactionRule(rf'\b{_MONTHS}[.,]?\s+\d{{1,2}}(?:st|nd|rd|th)?\b', '[DATE]', re.IGNORECASE, anchors=_MONTH_PREFIXES),
+
+    # Height (e.g., "Height: 5'10"" or "5 ft 10 in")
+    RedactionRule(r'\b(height|ht)[:.]\s*\d+\s*(?:\'|feet|ft|foot)?\s*\d*\s*(?:\"|inches|in|″)?', '[HEIGHT]', re.IGNORECASE, anchors=('height', 'ht')),
+    RedactionRule(r'\b\d+\s*(?:\'|feet|ft|foot)\s*\d*\s*(?:\"|inches|in|″)?', '[HEIGHT]', re.IGNORECASE, hints=("'", 'ft', 'feet', 'foot'), anchors=_DIGIT),
+
+    # Weight
+    RedactionRule(r'\b(weight|wt)[:.]\s*\d+\.?\d*\s*(kg|kilos|lb|lbs|pounds)\b', '[WEIGHT]', re.IGNORECASE, anchors=('weight', 'wt')),
+    RedactionRule(r'\b\d+\.?\d*\s*(kg|kilos|lb|lbs|pounds)\b', '[WEIGHT]', re.IGNORECASE, hints=('kg', 'kilos', 'lb', 'pounds'), anchors=_DIGIT),
+
     # BMI values
-    deidentified_text = re.sub(r'\b(BMI|Body Mass Index)[:.]\s*\d+\.?\d*\b', '[BMI]', deidentified_text, flags=re.IGNORECASE)
-    deidentified_text = re.sub(r'\bBMI\s+of\s+\d+\.?\d*\b', '[BMI]', deidentified_text, flags=re.IGNORECASE)
+    RedactionRule(r'\b(BMI|Body Mass Index)[:.]\s*\d+\.?\d*\b', '[BMI]', re.IGNORECASE, anchors=('bmi', 'body mass index')),
+    RedactionRule(r'\bBMI\s+of\s+\d+\.?\d*\b', '[BMI]', re.IGNORECASE, anchors=('bmi',)),
 
     # Address line (e.g., 123 Medical Way)
-    address_line_pattern = r'\b\d+\s+(?:[A-Za-z0-9]+\s)*?(?:Street|St|Avenue|Ave|Road|Rd|Boulevard|Blvd|Drive|Dr|Way|Lane|Ln|Place|Pl|Court|Ct|Terrace|Ter|Circle|Cir)\b'
-    deidentified_text = re.sub(address_line_pattern, '[ADDRESS]', deidentified_text, flags=re.IGNORECASE)
+    RedactionRule(r'\b\d+\s+(?:[A-Za-z0-9]+\s)*?(?:Street|St|Avenue|Ave|Road|Rd|Boulevard|Blvd|Drive|Dr|Way|Lane|Ln|Place|Pl|Court|Ct|Terrace|Ter|Circle|Cir)\b', '[ADDRESS]', re.IGNORECASE, anchors=_DIGIT),
 
-    
     # ZIP/Postal codes
-    deidentified_text = re.sub(r'\b\d{5}(?:-\d{4})?\b', '[ZIPCODE]', deidentified_text)
-
-    # Enhanced facility identification patterns - FIXED to be more precise
-    # Using word boundaries and more precise pattern matching to avoid over-capturing
-    facility_patterns = [
-        # Pattern to match "Name Hospital" or "Name Medical Center" but not surrounding text
-        (r"\b((?:[A-Z][A-Za-z0-9&\-\.'']+\s+)+)(Hospital|Medical Center|Clinic|Infirmary)\b", 
-         r"[HOSPITAL]"),
-        # Pattern for labs
-        (r"\b((?:[A-Z][A-Za-z0-9&\-\.'']+\s+)+)(Laboratory|Lab)\b", 
-         r"[LAB]"),
-        # Pattern for diagnostic centers
-        (r"\b((?:[A-Z][A-Za-z0-9&\-\.'']+\s+)+)(Diagnostic Center|Imaging Center|Diagnostics)\b", 
-         r"[DIAGNOSTIC_CENTER]")
-    ]
-    
-    for pattern, replacement in facility_patterns:
-        deidentified_text = re.sub(pattern, replacement, deidentified_text)
-    
-    # Additional catch for standalone facility names without preceding words
-    standalone_patterns = [
-        (r"\b(Hospital|Medical Center|Clinic|Infirmary)\b", "[HOSPITAL]"),
-        (r"\b(Laboratory|Lab)\b", "[LAB]"),
-        (r"\b(Diagnostic Center|Imaging Center|Healthcare Limited|Healthcare)\b", "[DIAGNOSTIC_CENTER]")
-    ]
-    
-    for pattern, replacement in standalone_patterns:
-        deidentified_text = re.sub(pattern, replacement, deidentified_text, flags=re.IGNORECASE)
-    
+    RedactionRule(r'\b\d{5}(?:-\d{4})?\b', '[ZIPCODE]', anchors=_DIGIT),
+
+    # Named facilities ("Name Hospital", "Name Lab", ...)
+    RedactionRule(r"\b((?:[A-Z][A-Za-z0-9&\-\.'']+\s+)+)(Hospital|Medical Center|Clinic|Infirmary)\b", '[HOSPITAL]', hints=('hospital', 'medical center', 'clinic', 'infirmary')),
+    RedactionRule(r"\b((?:[A-Z][A-Za-z0-9&\-\.'']+\s+)+)(Laboratory|Lab)\b", '[LAB]', hints=('lab',)),
+    RedactionRule(r"\b((?:[A-Z][A-Za-z0-9&\-\.'']+\s+)+)(Diagnostic Center|Imaging Center|Diagnostics)\b", '[DIAGNOSTIC_CENTER]', hints=('diagnostic', 'imaging center')),
+
+    # Standalone facility names without preceding words
+    RedactionRule(r"\b(Hospital|Medical Center|Clinic|Infirmary)\b", '[HOSPITAL]', re.IGNORECASE, anchors=('hospital', 'medical center', 'clinic', 'infirmary')),
+    RedactionRule(r"\b(Laboratory|Lab)\b", '[LAB]', re.IGNORECASE, anchors=('lab',)),
+    RedactionRule(r"\b(Diagnostic Center|Imaging Center|Healthcare Limited|Healthcare)\b", '[DIAGNOSTIC_CENTER]', re.IGNORECASE, anchors=('diagnostic center', 'imaging center', 'healthcare')),
+
     # Doctor identification
-    doctor_patterns = [
-        r"\bDr\.\s+[A-Z][a-z]+\b",
-        r"\bDoctor\s+[A-Z][a-z]+\b",
-        r"\b[A-Z][a-z]+,\s+M\.?D\.?\b",
-        r"\bM\.?D\.?\s+[A-Z][a-z]+\b"
-    ]
-    
-    for pattern in doctor_patterns:
-        deidentified_text = re.sub(pattern, "[PHYSICIAN]", deidentified_text)
-    
-    # Year patterns - identify and replace years
+    RedactionRule(r"\bDr\.\s+[A-Z][a-z]+\b", '[PHYSICIAN]', anchors=('dr.',)),
+    RedactionRule(r"\bDoctor\s+[A-Z][a-z]+\b", '[PHYSICIAN]', anchors=('doctor',)),
+    RedactionRule(r"\b[A-Z][a-z]+,\s+M\.?D\.?\b", '[PHYSICIAN]', hints=('md', 'm.d')),
+    RedactionRule(r"\bM\.?D\.?\s+[A-Z][a-z]+\b", '[PHYSICIAN]', anchors=('md', 'm.d')),
+
     # Years in context (diagnosed in 2018, treated in 2020, etc.)
-    deidentified_text = re.sub(r'\b(in|since|from|during|after|before|circa|around|about|by|until|till|to)\s+\d{4}\b', r'\1 [YEAR]', deidentified_text, flags=re.IGNORECASE)
-    
-    # Years by themselves (commonly 4-digit years from 1900-2030)
-    deidentified_text = re.sub(r'\b(19[0-9][0-9]|20[0-2][0-9]|203[0-5])\b', '[YEAR]', deidentified_text)
-    
-    # Seasons with years
-    deidentified_text = re.sub(r'\b(spring|summer|fall|winter|autumn)\s+of\s+\d{4}\b', r'\1 of [YEAR]', deidentified_text, flags=re.IGNORECASE)
-    
-    # Months with years
-    month_pattern = r'\b(January|February|March|April|May|June|July|August|September|October|November|December|Jan|Feb|Mar|Apr|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)'
-    deidentified_text = re.sub(f'{month_pattern}\\s+\\d{{4}}\\b', r'\1 [YEAR]', deidentified_text, flags=re.IGNORECASE)
+    RedactionRule(r'\b(in|since|from|during|after|before|circa|around|about|by|until|till|to)\s+\d{4}\b', r'\1 [YEAR]', re.IGNORECASE, anchors=('in', 'since', 'from', 'during', 'after', 'before', 'circa', 'around', 'about', 'by', 'until', 'till', 'to')),
+    # Years by themselves (1900-2035)
+    RedactionRule(r'\b(19[0-9][0-9]|20[0-2][0-9]|203[0-5])\b', '[YEAR]', anchors=('19', '20')),
+    # Seasons and months with years
+    RedactionRule(r'\b(spring|summer|fall|winter|autumn)\s+of\s+\d{4}\b', r'\1 of [YEAR]', re.IGNORECASE, anchors=('spring', 'summer', 'fall', 'winter', 'autumn')),
+    RedactionRule(rf'\b({_MONTHS})\s+\d{{4}}\b', r'\1 [YEAR]', re.IGNORECASE, anchors=_MONTH_PREFIXES),
 
     # Time patterns (12-hour and 24-hour formats)
-    time_patterns = [
-        r'\b(1[0-2]|0?[1-9]):[0-5][0-9]\s*(am|pm|AM|PM|a\.m\.|p\.m\.)\b',  # 12-hour format (3:45 PM)
-        r'\b([01]?[0-9]|2[0-3]):[0-5][0-9](:[0-5][0-9])?\b'                # 24-hour format (15:45)
-    ]
-
-    for pattern in time_patterns:
-        deidentified_text = re.sub(pattern, '[TIME]', deidentified_text)
+    RedactionRule(r'\b(1[0-2]|0?[1-9]):[0-5][0-9]\s*(am|pm|AM|PM|a\.m\.|p\.m\.)\b', '[TIME]', hints=(':',), anchors=_DIGIT),
+    RedactionRule(r'\b([01]?[0-9]|2[0-3]):[0-5][0-9](:[0-5][0-9])?\b', '[TIME]', hints=(':',), anchors=_DIGIT),
 
     # Website URLs
-    deidentified_text = re.sub(r'\bhttps?://[^\s]+\b', '[WEBSITE]', deidentified_text)
-    deidentified_text = re.sub(r'\bwww\.[^\s]+\b', '[WEBSITE]', deidentified_text)
-    deidentified_text = re.sub(r'\b[a-zA-Z0-9-]+\.(com|org|net|edu|gov|co|io|us|uk|ca|au)[^\s]*\b', '[WEBSITE]', deidentified_text)
+    RedactionRule(r'\bhttps?://[^\s]+\b', '[WEBSITE]', anchors=('http',)),
+    RedactionRule(r'\bwww\.[^\s]+\b', '[WEBSITE]', anchors=('www.',)),
+    RedactionRule(r'\b[a-zA-Z0-9-]+\.(com|org|net|edu|gov|co|io|us|uk|ca|au)[^\s]*\b', '[WEBSITE]'),
+
+    # Visit IDs with various spacing around separators
+    RedactionRule(r'\bVisit\s+(?:ID|Id|id|#)?(?:\s*[:.\s-]\s*)\d+\b', '[VISIT_ID]', re.IGNORECASE, anchors=('visit',)),
+    RedactionRule(r'\bVisit\s+(?:ID|Id|id|#)?(?:\s*[:.\s-]\s*)[A-Z0-9][-A-Z0-9]*\b', '[VISIT_ID]', re.IGNORECASE, anchors=('visit',)),
+
+    # Industrial addresses with plot numbers, blocks, etc.
+    RedactionRule(r'\b(?:[A-Za-z0-9]+\s+)+(?:Industries|Industrial|Compound|Plaza|Complex)(?:\s*,\s*Plot\s+(?:No\.?|Number)?\s*[-:.]?\s*[A-Za-z0-9-]+)?(?:\s*,\s*Block\s+[A-Za-z0-9-]+)?(?:\s*,\s*[A-Za-z0-9\s]+(?:Industrial|Business|Commercial|Estate|Scheme|Area|Zone))?(?:\s*,\s*[A-Za-z\s]+)?(?:\s*,\s*[A-Za-z]+)?\b', '[COMPLEX_ADDRESS]', re.IGNORECASE, hints=('industr', 'compound', 'plaza', 'complex')),
+    # Plot numbers with block designations
+    RedactionRule(r'\bPlot\s+(?:No\.?|Number)?\s*[-:.]?\s*[A-Za-z0-9-]+(?:\s*,\s*Block\s+[A-Za-z0-9-]+)?\b', '[COMPLEX_ADDRESS]', re.IGNORECASE, anchors=('plot',)),
+]
+
+
+class RedactionEngine:
+    """
+    Single-pass redaction over a fixed, precompiled rule set.
+
+    Rules run in priority order against a masked view of the text in which
+    spans claimed by earlier rules are blanked out, so they act as boundaries
+    just like inserted placeholders did. A later match that runs through
+    claimed spans replaces them as well, as re.sub over the placeholder text
+    would have. Replacements are only applied at the end, in one join.
+    """
+
+    # Claimed spans are blanked to look like a placeholder: non-word edges around
+    # word characters that no rule's character class matches ("[LAB]" -> "\0ĀĀĀ\0")
+    MASK = "\x00"
+    MASK_FILL = "\u0100"
+
+    def __init__(self, rules):
+        self.rules = []
+        for rule in rules:
+            # A leading \1 keeps that group as plain text, still visible to later rules
+            keep_group = rule.replacement.startswith("\\1")
+            replacement = rule.replacement[2:] if keep_group else rule.replacement
+            self.rules.append((re.compile(rule.pattern, rule.flags), replacement, keep_group, rule.hints, rule.anchors))
+
+    @staticmethod
+    def _anchor_offsets(text, lowered, anchors):
+        if isinstance(anchors, re.Pattern):
+            return [match.start() for match in anchors.finditer(text)]
+        offsets = set()
+        for anchor in anchors:
+            i = lowered.find(anchor)
+            while i != -1:
+                offsets.add(i)
+                i = lowered.find(anchor, i + 1)
+        return sorted(offsets)
+
+    @staticmethod
+    def _finditer(regex, text, offsets):
+        # regex.finditer(text), only trying `offsets` when the rule is anchored
+        if offsets is None:
+            yield from regex.finditer(text)
+            return
+        pos = 0
+        for offset in offsets:
+            if offset < pos:
+                continue
+            match = regex.match(text, offset)
+            if match:
+                yield match
+                pos = max(match.end(), offset + 1)
+
+    def _mask(self, text, spans):
+        parts = []
+        last = 0
+        for start, end, _ in spans:
+            parts.append(text[last:start])
+            width = end - start
+            parts.append(self.MASK * width if width < 3 else self.MASK + self.MASK_FILL * (width - 2) + self.MASK)
+            last = end
+        parts.append(text[last:])
+        return "".join(parts)
+
+    def collect_spans(self, text, entity_replacements=None):
+        """
+        Return sorted, non-overlapping (start, end, replacement) spans for `text`.
+        Occurrences of `entity_replacements` keys ({text: placeholder}) take priority over the rules.
+        """
+        spans = []
+        if entity_replacements:
+            # Longest first so overlapping entity strings prefer the fuller match
+            names = sorted(entity_replacements, key=len, reverse=True)
+            entity_regex = re.compile("|".join(re.escape(name) for name in names))
+            spans = [(m.start(), m.end(), entity_replacements[m.group(0)]) for m in entity_regex.finditer(text)]
+
+        masked = self._mask(text, spans) if spans else text
+        lowered = text.lower()
+        # Offsets found in the lowered text only line up if lowering kept every character's width
+        aligned = len(lowered) == len(text)
+        offsets_by_anchor = {}
+        for regex, replacement, keep_group, hints, anchors in self.rules:
+            if hints and not any(hint in lowered for hint in hints):
+                continue
+            offsets = None
+            if isinstance(anchors, re.Pattern) or (anchors and aligned):
+                if anchors not in offsets_by_anchor:
+                    offsets_by_anchor[anchors] = self._anchor_offsets(text, lowered, anchors)
+                offsets = offsets_by_anchor[anchors]
+
+            new_spans = []
+            absorbed = set()
+            for match in self._finditer(regex, masked, offsets):
+                start, end = match.span()
+                if start == end:
+                    continue
+                if keep_group:
+                    start = match.end(1)
+                if self.MASK in masked[start:end] or self.MASK_FILL in masked[start:end]:
+                    # The match runs through earlier placeholders (e.g. a facility name inside
+                    # a URL); like re.sub over the placeholder text, it replaces them too
+                    for span in spans:
+                        if span[0] < end and start < span[1]:
+                            if span in absorbed and new_spans and new_spans[-1][1] > span[0]:
+                                start = new_spans.pop()[0]
+                            absorbed.add(span)
+                            start, end = min(start, span[0]), max(end, span[1])
+                new_spans.append((start, end, match.expand(replacement) if "\\" in replacement else replacement))
+
+            if new_spans:
+                spans = sorted([span for span in spans if span not in absorbed] + new_spans)
+                masked = self._mask(text, spans)
+        return spans
+
+    def redact(self, text, entity_replacements=None):
+        """
+        Redact `text` and return the result.
+        """
+        parts = []
+        last = 0
+        for start, end, replacement in self.collect_spans(text, entity_replacements):
+            parts.append(text[last:start])
+            parts.append(replacement)
+            last = end
+        parts.append(text[last:])
+        return "".join(parts)
+
+
+redaction_engine = RedactionEngine(REDACTION_RULES)
+
+
+def _entity_replacements(doc):
+    # Map entity text to its placeholder; the first label seen for a text wins
+    replacements = {}
+    for ent in doc.ents:
+        if ent.text in replacements or not ent.text.strip():
+            continue
+        if ent.label_ == "PERSON":
+            replacements[ent.text] = "[PERSON]"
+        elif ent.label_ == "DATE" and _ENTITY_AGE_PATTERN.search(ent.text):
+            replacements[ent.text] = "[AGE]"
+        elif ent.label_ in ["GPE", "LOC"]:
+            replacements[ent.text] = "[LOCATION]"
+    return replacements
+
+
+def deidentify_patient_info(text):
+    """
+    Remove patient identifying information from medical text
+    """
+    if not text or not isinstance(text, str):
+        return text
+
+    with metrics.stage("deidentify"):
+        nlp = get_nlp()
+        if len(text) > nlp.max_length:
+            return "".join(iter_deidentify_document(text))
+        with metrics.stage("spacy_ner"):
+            doc = nlp(text)
+        with metrics.stage("redaction"):
+            return redaction_engine.redact(text, _entity_replacements(doc))
+
+
+# Pages are split on form feeds (extract_text_from_pdf ends each page with one),
+# then on blank lines, then on whitespace as a last resort
+_PAGE_PATTERN = re.compile(r'[^\f]*\f|[^\f]+')
+_PARAGRAPH_PATTERN = re.compile(r'.*?(?:\n[ \t]*\n\s*|$)', re.DOTALL)
+
+
+def _split_oversized(segment, max_chars):
+    if len(segment) <= max_chars:
+        yield segment
+        return
+    for match in _PARAGRAPH_PATTERN.finditer(segment):
+        paragraph = match.group(0)
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind(" ", 0, max_chars) + 1 or max_chars
+            yield paragraph[:cut]
+            paragraph = paragraph[cut:]
+        if paragraph:
+            yield paragraph
+
+
+def _iter_pieces(source, max_chars):
+    # Pack pages (or paragraphs of oversized pages) into pieces of at most max_chars
+    segments = (m.group(0) for m in _PAGE_PATTERN.finditer(source)) if isinstance(source, str) else source
+    piece = []
+    size = 0
+    for segment in segments:
+        for part in _split_oversized(segment, max_chars):
+            if size + len(part) > max_chars and piece:
+                yield "".join(piece)
+                piece, size = [], 0
+            piece.append(part)
+            size += len(part)
+    if piece:
+        yield "".join(piece)
+
+
+def iter_deidentify_document(source, max_chars=100_000, overlap=500):
+    """
+    De-identify a large document piece by piece, yielding redacted text as it goes.
+
+    `source` is either the full text or an iterable of page strings. Pieces break
+    on pages, then paragraphs, and each one is analysed together with `overlap`
+    characters of its neighbours so entities crossing a boundary are still caught;
+    joining the yielded strings gives the whole de-identified document. Only about
+    three pieces are held at a time. Entity names found earlier in the document are
+    also redacted in later pieces.
+    """
+    nlp = get_nlp()
+    known_entities = {}
+    pieces = _iter_pieces(source, max_chars)
+    current = next(pieces, None)
+    left = ""
+    carry = 0  # characters at the start of `current` already covered by the previous piece
+
+    while current is not None:
+        following = next(pieces, None)
+        right = following[:overlap] if following else ""
+        window = left + current + right
+
+        for name, placeholder in _entity_replacements(nlp(window)).items():
+            known_entities.setdefault(name, placeholder)
+
+        start = len(left)
+        end = start + len(current)
+        cursor = start + carry
+        parts = []
+        for span_start, span_end, replacement in redaction_engine.collect_spans(window, known_entities):
+            if span_start < cursor:
+                continue
+            if span_start >= end:
+                break
+            parts.append(window[cursor:span_start])
+            parts.append(replacement)
+            cursor = span_end
+        if cursor < end:
+            parts.append(window[cursor:end])
+        yield "".join(parts)
+
+        carry = max(0, cursor - end)
+        left = current[-overlap:] if overlap else ""
+        current = following
+
+
+class IncrementalDeidentifier:
+    """
+    De-identifies successive edits of the same document, running spaCy only on
+    paragraphs it has not analysed before. Entities found in any paragraph are
+    still redacted everywhere, and the regex rules run over the whole text, so
+    an edit gives the same result as a fresh instance would.
+    """
+
+    def __init__(self):
+        self._entities = {}  # paragraph text -> {entity text: placeholder}
+
+    def _paragraphs(self, text, max_chars):
+        return [part for match in _PARAGRAPH_PATTERN.finditer(text)
+                for part in _split_oversized(match.group(0), max_chars) if part.strip()]
+
+    def deidentify(self, text):
+        if not _is_text(text):
+            return text
+
+        nlp = get_nlp()
+        with metrics.stage("deidentify"):
+            paragraphs = list(dict.fromkeys(self._paragraphs(text, nlp.max_length)))
+            new = [paragraph for paragraph in paragraphs if paragraph not in self._entities]
+            with metrics.stage("spacy_ner"):
+                for paragraph, doc in zip(new, nlp.pipe(new)):
+                    self._entities[paragraph] = _entity_replacements(doc)
+            metrics.increment("paragraphs_analyzed", len(new))
+            metrics.increment("paragraphs_reused", len(paragraphs) - len(new))
+            if new:
+                logging.info(f"🔁 Re-analysed {len(new)} of {len(paragraphs)} paragraphs")
+
+            # Forget paragraphs that were edited away
+            self._entities = {paragraph: self._entities[paragraph] for paragraph in paragraphs}
+            entity_replacements = {}
+            for replacements in self._entities.values():
+                for name, placeholder in replacements.items():
+                    entity_replacements.setdefault(name, placeholder)
+            with metrics.stage("redaction"):
+                return redaction_engine.redact(text, entity_replacements)
+
+
+def _is_text(text):
+    return bool(text) and isinstance(text, str)
+
+
+def _deidentify_many(texts, batch_size=32):
+    # Runs in the calling process or in a pool worker; empty and non-string items pass through
+    nlp = get_nlp()
+    piped = [text for text in texts if _is_text(text) and len(text) <= nlp.max_length]
+    docs = nlp.pipe(piped, batch_size=batch_size)
+    results = []
+    for text in texts:
+        if not _is_text(text):
+            results.append(text)
+        elif len(text) > nlp.max_length:
+            results.append("".join(iter_deidentify_document(text)))
+        else:
+            results.append(redaction_engine.redact(text, _entity_replacements(next(docs))))
+    return results
+
+
+def iter_deidentify_batch(texts, n_process=1, batch_size=32):
+    """
+    Lazily de-identify an iterable of texts, yielding results in input order.
+    With n_process > 1 (or -1 for every core), batches of `batch_size` texts are
+    run through nlp.pipe and redacted in worker processes, with a bounded number
+    of batches in flight so arbitrarily long streams use constant memory.
+    """
+    if n_process == -1:
+        n_process = os.cpu_count() or 1
+    texts = iter(texts)
+    batches = iter(lambda: list(islice(texts, batch_size)), [])
+
+    if n_process <= 1:
+        for batch in batches:
+            yield from _deidentify_many(batch, batch_size)
+        return
+
+    # Load before forking so workers share the parent's copy of the model
+    get_nlp()
+    with multiprocessing.Pool(n_process, initializer=_init_worker, initargs=(_spacy_model,)) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.apply_async(_deidentify_many, (batch, batch_size)))
+            if len(pending) >= 2 * n_process:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def deidentify_batch(texts, n_process=1, batch_size=32):
+    """
+    De-identify a list of texts and return the results in input order
+    """
+    return list(iter_deidentify_batch(texts, n_process=n_process, batch_size=batch_size))
+
+
+def _iter_records(source, text_field):
+    if os.path.isdir(source):
+        from file_loader import SUPPORTED_EXTENSIONS, extract_text_from_path
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if os.path.isfile(path) and name.lower().endswith(SUPPORTED_EXTENSIONS):
+                yield {"id": name, text_field: extract_text_from_path(path)}
+    else:
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
 
-    # Visit ID patterns - updated to handle various spacing around separators
-    deidentified_text = re.sub(r'\bVisit\s+(?:ID|Id|id|#)?(?:\s*[:.\s-]\s*)\d+\b', '[VISIT_ID]', deidentified_text, flags=re.IGNORECASE)
-    deidentified_text = re.sub(r'\bVisit\s+(?:ID|Id|id|#)?(?:\s*[:.\s-]\s*)[A-Z0-9][-A-Z0-9]*\b', '[VISIT_ID]', deidentified_text, flags=re.IGNORECASE)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="De-identify a directory of reports or a JSONL file, writing JSONL.")
+    parser.add_argument("source", help="Directory of .txt/.pdf/.docx/image files, or a JSONL file")
+    parser.add_argument("-o", "--output", help="Output JSONL path (default: stdout)")
+    parser.add_argument("--text-field", default="text", help="JSON field holding the report text")
+    parser.add_argument("--n-process", type=int, default=1, help="Worker processes (-1 for all cores)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Texts per nlp.pipe batch")
+    parser.add_argument("--model", help=f"spaCy model name or path (default: $SPACY_MODEL or {DEFAULT_SPACY_MODEL})")
+    args = parser.parse_args(argv)
+    if args.model:
+        set_spacy_model(args.model)
 
-    # Complex address patterns (industrial areas, compounds, plots)
-    complex_address_patterns = [
-        # Pattern for industrial addresses with plot numbers, blocks, etc.
-        r'\b(?:[A-Za-z0-9]+\s+)+(?:Industries|Industrial|Compound|Plaza|Complex)(?:\s*,\s*Plot\s+(?:No\.?|Number)?\s*[-:.]?\s*[A-Za-z0-9-]+)?(?:\s*,\s*Block\s+[A-Za-z0-9-]+)?(?:\s*,\s*[A-Za-z0-9\s]+(?:Industrial|Business|Commercial|Estate|Scheme|Area|Zone))?(?:\s*,\s*[A-Za-z\s]+)?(?:\s*,\s*[A-Za-z]+)?\b',
-        
-        # Pattern for plot numbers with block designations
-        r'\bPlot\s+(?:No\.?|Number)?\s*[-:.]?\s*[A-Za-z0-9-]+(?:\s*,\s*Block\s+[A-Za-z0-9-]+)?\b',
-    ]
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    records, texts = tee(_iter_records(args.source, args.text_field))
+    texts = (record.get(args.text_field) for record in texts)
+    results = iter_deidentify_batch(texts, n_process=args.n_process, batch_size=args.batch_size)
 
-    for pattern in complex_address_patterns:
-        deidentified_text = re.sub(pattern, '[COMPLEX_ADDRESS]', deidentified_text, flags=re.IGNORECASE)
-    
-    return deidentified_text
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for count, (record, deidentified) in enumerate(zip(records, results), start=1):
+            record[args.text_field] = deidentified
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if count % 100 == 0:
+                logging.info(f"🔒 De-identified {count} records")
+    finally:
+        if out is not sys.stdout:
+            out.close()
 
 
+if __name__ == "__main__":
+    main()
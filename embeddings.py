@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+import metrics
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_MAX_CACHED_VECTORS = 50_000
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingService(Embeddings):
+    """
+    Sentence-transformer embeddings loaded once and shared, with batching and
+    an in-memory chunk-hash -> vector cache (least recently used entries are
+    dropped past `max_cached_vectors`). Cached vectors are kept as float32
+    arrays, about 1.5 KB each at 384 dimensions rather than ~12 KB as Python
+    lists. Usable anywhere LangChain expects an Embeddings object.
+    """
+
+    def __init__(self, model_name=DEFAULT_EMBEDDING_MODEL, batch_size=DEFAULT_BATCH_SIZE,
+                 max_cached_vectors=DEFAULT_MAX_CACHED_VECTORS):
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_cached_vectors = max_cached_vectors
+        self.hits = 0
+        self.misses = 0
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self._model = HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
+        logging.info(f"🧬 Loaded embedding model {model_name}.")
+
+    def _lookup(self, key):
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+            return vector
+
+    def _store(self, key, vector):
+        import numpy as np
+
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_cached_vectors:
+                self._vectors.popitem(last=False)
+        return vector
+
+    def embed_documents(self, texts):
+        keys = [text_hash(text) for text in texts]
+        vectors = [self._lookup(key) for key in keys]
+
+        # Embed each distinct missing text once, in batches
+        missing = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        reused = len(texts) - sum(vector is None for vector in vectors)
+        self.hits += reused
+        self.misses += len(missing)
+        metrics.increment("embedding_cache_hits", reused)
+        metrics.increment("embedded_chunks", len(missing))
+
+        pending = list(missing.items())
+        fresh = {}
+        with metrics.stage("embed"):
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                for (key, _), vector in zip(batch, self._model.embed_documents([text for _, text in batch])):
+                    fresh[key] = self._store(key, vector)
+        if pending:
+            logging.info(f"🧬 Embedded {len(pending)} new chunks, reused {len(texts) - len(pending)}.")
+
+        return [(vector if vector is not None else fresh[key]).tolist() for key, vector in zip(keys, vectors)]
+
+    def embed_query(self, text):
+        key = "query:" + text_hash(text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = self._store(key, self._model.embed_query(text))
+        return vector.tolist()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "cached_vectors": len(self._vectors),
+        }
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_embedding_service(model_name=DEFAULT_EMBEDDING_MODEL, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Return the process-wide EmbeddingService for `model_name`, loading it on first use
+    """
+    with _services_lock:
+        service = _services.get(model_name)
+        if service is None:
+            service = _services[model_name] = EmbeddingService(model_name, batch_size=batch_size)
+        return service
@@ -1,26 +1,207 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from docx import Document as DocxDocument
-from PIL import Image
+from io import BytesIO
+from PIL import Image, ImageSequence
 import pytesseract
 import fitz  # pymupdf
-import tempfile
+import hashlib
+import metrics
+import multiprocessing
 import os
+import threading
+
+# Fewer scanned pages than this are OCR'd in the calling process
+PARALLEL_MIN_OCR_PAGES = 2
+DEFAULT_OCR_DPI = 300
+# Frames taller than this (in pixels at the target DPI) are OCR'd in strips, roughly a letter page each
+DEFAULT_TILE_HEIGHT = 3300
+BINARIZE_THRESHOLD = 160
+MAX_CACHED_OCR_RESULTS = 256
+
+_ocr_pools = {}
+_ocr_pools_lock = threading.Lock()
+_ocr_cache = OrderedDict()
+_ocr_cache_lock = threading.Lock()
+
+def _read_bytes(uploaded_file):
+    if isinstance(uploaded_file, (bytes, bytearray)):
+        return bytes(uploaded_file)
+    if hasattr(uploaded_file, "getvalue"):
+        return uploaded_file.getvalue()
+    return uploaded_file.read()
+
+def _ocr_page(page, dpi):
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    return pytesseract.image_to_string(image)
+
+def _ocr_pdf_page(page_pdf, dpi):
+    # Runs in a pool worker on a one-page PDF, so only that page crosses the process boundary
+    with fitz.open(stream=page_pdf, filetype="pdf") as doc:
+        return _ocr_page(doc[0], dpi)
+
+def _single_page_pdf(doc, page_number):
+    with fitz.open() as page_doc:
+        page_doc.insert_pdf(doc, from_page=page_number, to_page=page_number)
+        return page_doc.tobytes()
+
+def _get_ocr_pool(max_workers):
+    """
+    Long-lived OCR worker pool, shared by every extraction in this process
+    """
+    with _ocr_pools_lock:
+        pool = _ocr_pools.get(max_workers)
+        if pool is None:
+            # Callers are multithreaded (Streamlit, service jobs, pipeline stages), where forking can deadlock the child
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            pool = _ocr_pools[max_workers] = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context(start_method)
+            )
+        return pool
+
+def iter_pdf_pages(uploaded_file, max_workers=None, ocr_dpi=DEFAULT_OCR_DPI):
+    """
+    Yield (page_number, text) for each page of a PDF, in page order.
+
+    The PDF is opened from memory and text layers are read in this process,
+    which takes a few milliseconds per page. Pages without a text layer (scans)
+    are rendered at `ocr_dpi` and OCR'd with Tesseract, in a shared pool of
+    worker processes when there are several of them; pass ocr_dpi=None to skip
+    OCR.
+    """
+    data = _read_bytes(uploaded_file)
+    max_workers = max_workers or os.cpu_count() or 1
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        texts = [doc[n].get_text() for n in range(doc.page_count)]
+        scanned = [n for n, text in enumerate(texts) if not text.strip()] if ocr_dpi else []
+        futures = {}
+        if len(scanned) >= PARALLEL_MIN_OCR_PAGES and max_workers > 1:
+            pool = _get_ocr_pool(max_workers)
+            futures = {n: pool.submit(_ocr_pdf_page, _single_page_pdf(doc, n), ocr_dpi) for n in scanned}
+
+        for n, text in enumerate(texts):
+            if n in futures:
+                text = futures[n].result()
+            elif n in scanned:
+                text = _ocr_page(doc[n], ocr_dpi)
+            metrics.increment("ocr_pages" if n in scanned else "text_pages")
+            yield n, text
+
+def extract_pdf_pages(uploaded_file, max_workers=None, ocr_dpi=DEFAULT_OCR_DPI):
+    """
+    Return a list of page texts, indexed by page number
+    """
+    with metrics.stage("extract_pdf"):
+        return [text for _, text in iter_pdf_pages(uploaded_file, max_workers=max_workers, ocr_dpi=ocr_dpi)]
 
 def extract_text_from_pdf(uploaded_file):
-    text = ""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        tmp_file.write(uploaded_file.read())
-        tmp_file_path = tmp_file.name
-    doc = fitz.open(tmp_file_path)
-    for page in doc:
-        text += page.get_text() + "\f"
-    doc.close()
-    os.remove(tmp_file_path)
-    return text
+    return "".join(text + "\f" for text in extract_pdf_pages(uploaded_file))
 
 def extract_text_from_docx(uploaded_file):
-    document = DocxDocument(uploaded_file)
-    return "\n".join([p.text for p in document.paragraphs])
+    with metrics.stage("extract_docx"):
+        document = DocxDocument(uploaded_file)
+        return "\n".join([p.text for p in document.paragraphs])
 
-def extract_text_from_image(uploaded_file):
-    image = Image.open(uploaded_file)
-    return pytesseract.image_to_string(image)
+def _normalize_frame(frame, target_dpi, binarize):
+    """
+    Grayscale copy of a frame, downsampled to `target_dpi` if it was scanned finer
+    """
+    dpi = frame.info.get("dpi", (0, 0))[0] or 0
+    image = frame.convert("L")
+    if target_dpi and dpi > target_dpi:
+        scale = target_dpi / dpi
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS)
+    if binarize:
+        image = image.point(lambda v: 255 if v > BINARIZE_THRESHOLD else 0)
+    return image
+
+def _split_tiles(image, tile_height):
+    """
+    Cut a tall image into horizontal strips, each cut on the whitest row near
+    the nominal boundary so that text lines are not sliced in half
+    """
+    if image.height <= tile_height * 1.5:
+        return [image]
+    window = tile_height // 10
+    cuts = [0]
+    while image.height - cuts[-1] > tile_height * 1.5:
+        lo = cuts[-1] + tile_height - window
+        hi = cuts[-1] + tile_height + window
+        # Average each row down to a single pixel and pick the brightest
+        rows = list(image.crop((0, lo, image.width, hi)).resize((1, hi - lo), Image.BOX).getdata())
+        cuts.append(lo + rows.index(max(rows)))
+    cuts.append(image.height)
+    return [image.crop((0, top, image.width, bottom)) for top, bottom in zip(cuts, cuts[1:])]
+
+def extract_text_from_image(uploaded_file, target_dpi=DEFAULT_OCR_DPI, binarize=False,
+                            tile_height=DEFAULT_TILE_HEIGHT, max_workers=None):
+    """
+    OCR an image upload, including every frame of a multi-page TIFF.
+
+    Frames are converted to grayscale, downsampled to `target_dpi` and optionally
+    binarized, tall frames are split into strips, and all strips are OCR'd
+    concurrently. Results are cached by image content. Frames are separated by
+    form feeds, like PDF pages.
+    """
+    data = _read_bytes(uploaded_file)
+    key = hashlib.sha256(data).hexdigest() + f":{target_dpi}:{binarize}:{tile_height}"
+    with _ocr_cache_lock:
+        if key in _ocr_cache:
+            _ocr_cache.move_to_end(key)
+            metrics.increment("ocr_cache_hits")
+            return _ocr_cache[key]
+
+    with metrics.stage("ocr_image"):
+        text = _ocr_image(data, target_dpi, binarize, tile_height, max_workers)
+
+    with _ocr_cache_lock:
+        _ocr_cache[key] = text
+        while len(_ocr_cache) > MAX_CACHED_OCR_RESULTS:
+            _ocr_cache.popitem(last=False)
+    return text
+
+def _ocr_image(data, target_dpi, binarize, tile_height, max_workers):
+    with Image.open(BytesIO(data)) as image:
+        frames = [
+            _split_tiles(_normalize_frame(frame, target_dpi, binarize), tile_height)
+            for frame in ImageSequence.Iterator(image)
+        ]
+
+    tiles = [tile for frame_tiles in frames for tile in frame_tiles]
+    if len(tiles) == 1:
+        tile_texts = [pytesseract.image_to_string(tiles[0])]
+    else:
+        # Each pytesseract call runs its own tesseract process, so threads are enough to use every core
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+            tile_texts = list(pool.map(pytesseract.image_to_string, tiles))
+
+    frame_texts = []
+    for frame_tiles in frames:
+        frame_texts.append("\n".join(tile_texts[:len(frame_tiles)]))
+        tile_texts = tile_texts[len(frame_tiles):]
+    metrics.increment("ocr_tiles", len(tiles))
+    return "\f".join(frame_texts)
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".docx", ".png", ".jpg", ".jpeg", ".tif", ".tiff")
+
+def extract_text(filename, data):
+    """
+    Extract text from an uploaded report's bytes, picking the loader by file extension
+    """
+    lower = filename.lower()
+    if lower.endswith(".txt"):
+        return data.decode("utf-8")
+    if lower.endswith(".pdf"):
+        return extract_text_from_pdf(data)
+    if lower.endswith(".docx"):
+        return extract_text_from_docx(BytesIO(data))
+    return extract_text_from_image(data)
+
+def extract_text_from_path(path):
+    """
+    Extract text from a report on disk, picking the loader by file extension
+    """
+    with open(path, "rb") as f:
+        return extract_text(path, f.read())
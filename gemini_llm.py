@@ -0,0 +1,41 @@
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from pydantic import Field
+from typing import Iterator, List
+from google.generativeai import GenerativeModel
+
+DEFAULT_GEMINI_MODEL = "gemini-2.0-flash"
+DEFAULT_GENERATION_CONFIG = {"max_output_tokens": 512, "temperature": 0.5}
+
+# LLM Wrapper
+class GeminiLLMWrapper(LLM):
+    client: object = Field(...)
+    model_name: str = ""
+    generation_config: dict = Field(default_factory=dict)
+
+    def _call(self, prompt: str, stop: List[str] = None) -> str:
+        response = self.client.generate_content(prompt)
+        return response.text
+
+    def _stream(self, prompt: str, stop: List[str] = None, run_manager=None, **kwargs) -> Iterator[GenerationChunk]:
+        for response in self.client.generate_content(prompt, stream=True):
+            chunk = GenerationChunk(text=response.text)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name, "generation_config": self.generation_config}
+
+    @property
+    def _llm_type(self) -> str:
+        return "google-gemini"
+
+def build_gemini_llm(model_name=DEFAULT_GEMINI_MODEL, generation_config=None):
+    """
+    Wrap a Gemini model for LangChain; call google.generativeai.configure first
+    """
+    generation_config = dict(generation_config or DEFAULT_GENERATION_CONFIG)
+    gemini_model = GenerativeModel(model_name=model_name, generation_config=generation_config)
+    return GeminiLLMWrapper(client=gemini_model, model_name=model_name, generation_config=generation_config)
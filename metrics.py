@@ -0,0 +1,165 @@
+import contextvars
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROMETHEUS_PREFIX = "medsum"
+
+# Metrics objects that the current report's work should also be recorded into
+_active = contextvars.ContextVar("active_metrics", default=())
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Metrics:
+    """
+    Thread-safe per-stage timings and named counters.
+
+    Each stage accumulates its call count, wall time, CPU time of the thread
+    that ran it, and the most any one call raised the process's peak RSS (0 for
+    stages that fit in memory already reached earlier). Counters hold things
+    like LLM calls, retries and prompt/response tokens.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, wall_seconds, cpu_seconds=0.0, rss_growth_bytes=0):
+        with self._lock:
+            stats = self.stages.setdefault(
+                name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "rss_growth_bytes": 0}
+            )
+            stats["calls"] += 1
+            stats["wall_seconds"] += wall_seconds
+            stats["cpu_seconds"] += cpu_seconds
+            stats["rss_growth_bytes"] = max(stats["rss_growth_bytes"], rss_growth_bytes)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_json(self):
+        with self._lock:
+            return {
+                "stages": {name: dict(stats) for name, stats in self.stages.items()},
+                "counters": dict(self.counters),
+                "process_peak_rss_bytes": _peak_rss_bytes(),
+            }
+
+    def to_prometheus(self, prefix=PROMETHEUS_PREFIX):
+        snapshot = self.to_json()
+        lines = []
+        stage_series = (
+            ("stage_calls_total", "counter", "calls"),
+            ("stage_wall_seconds_total", "counter", "wall_seconds"),
+            ("stage_cpu_seconds_total", "counter", "cpu_seconds"),
+            ("stage_rss_growth_bytes", "gauge", "rss_growth_bytes"),
+        )
+        for metric, kind, field in stage_series:
+            lines.append(f"# TYPE {prefix}_{metric} {kind}")
+            for stage, stats in sorted(snapshot["stages"].items()):
+                lines.append(f'{prefix}_{metric}{{stage="{stage}"}} {stats[field]}')
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        lines.append(f"# TYPE {prefix}_process_peak_rss_bytes gauge")
+        lines.append(f"{prefix}_process_peak_rss_bytes {snapshot['process_peak_rss_bytes']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+
+
+# Process-wide totals, e.g. for a Prometheus endpoint or the batch CLI
+REGISTRY = Metrics()
+
+
+def _targets():
+    return (REGISTRY,) + _active.get()
+
+
+@contextmanager
+def stage(name):
+    """
+    Time the enclosed block as one call of stage `name`
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    # ru_maxrss is a lifetime high-water mark, so only its growth during the block is the stage's own
+    peak_start = _peak_rss_bytes()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.thread_time() - cpu_start
+        growth = _peak_rss_bytes() - peak_start
+        for metrics in _targets():
+            metrics.add_stage(name, wall, cpu, growth)
+
+
+def record_stage(name, wall_seconds):
+    """
+    Record time measured elsewhere (e.g. sleeping on a rate limit) as stage `name`
+    """
+    for metrics in _targets():
+        metrics.add_stage(name, wall_seconds)
+
+
+def increment(name, value=1):
+    for metrics in _targets():
+        metrics.increment(name, value)
+
+
+@contextmanager
+def track(metrics=None):
+    """
+    Also record everything done inside the block (and in work started with
+    propagate_context from it) into `metrics`, e.g. to break down one report
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    token = _active.set(_active.get() + (metrics,))
+    try:
+        yield metrics
+    finally:
+        _active.reset(token)
+
+
+def propagate_context(fn):
+    """
+    Wrap `fn` so that it runs with the caller's tracked metrics when called from
+    another thread (thread pools do not inherit context variables)
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+def write_metrics(path, metrics=REGISTRY):
+    """
+    Write metrics to `path`, as Prometheus text for .prom/.txt files and JSON otherwise
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        if path.endswith((".prom", ".txt")):
+            f.write(metrics.to_prometheus())
+        else:
+            json.dump(metrics.to_json(), f, indent=2)
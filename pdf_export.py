@@ -0,0 +1,217 @@
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+import metrics
+
+DEFAULT_PDF_DIR = os.path.join(".cache", "pdfs")
+DEFAULT_MAX_PDF_DIR_BYTES = 200 * 1024 * 1024
+# Cached PDFs used this recently are never evicted, so a response still being sent keeps its file
+EVICTION_GRACE_SECONDS = 300
+MAX_CACHED_PDFS = 64
+
+_pdf_cache = OrderedDict()
+_pdf_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _styles():
+    # Building the sample stylesheet is a noticeable part of a small PDF; do it once per process
+    return getSampleStyleSheet()
+
+
+def summary_key(practitioner_summary, patient_summary):
+    """
+    Content hash of the summaries a PDF is rendered from
+    """
+    payload = json.dumps([practitioner_summary or "", patient_summary or ""])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _elements(practitioner_summary, patient_summary):
+    styles = _styles()
+    elements = []
+
+    if practitioner_summary:
+        elements.append(Paragraph("👨‍⚕️ Summary for Practitioner", styles['Heading2']))
+        elements.append(Spacer(1, 12))
+        for para in practitioner_summary.split('\n'):
+            if para.strip():
+                elements.append(Paragraph(para.strip(), styles['BodyText']))
+                elements.append(Spacer(1, 6))
+
+    if patient_summary:
+        elements.append(Spacer(1, 24))
+        elements.append(Paragraph("👤 Summary for Patient", styles['Heading2']))
+        elements.append(Spacer(1, 12))
+        for para in patient_summary.split('\n'):
+            if para.strip():
+                elements.append(Paragraph(para.strip(), styles['BodyText']))
+                elements.append(Spacer(1, 6))
+
+    return elements
+
+
+def write_pdf(practitioner_summary, patient_summary, destination):
+    """
+    Render the summaries into `destination`, a path or a binary file object.
+    ReportLab assembles the whole document in memory before writing it out.
+    Paths are written to a temporary file first so readers never see a partial
+    PDF.
+    """
+    with metrics.stage("pdf_render"):
+        if not isinstance(destination, str):
+            SimpleDocTemplate(destination, pagesize=letter).build(_elements(practitioner_summary, patient_summary))
+            return destination
+        partial = f"{destination}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            SimpleDocTemplate(partial, pagesize=letter).build(_elements(practitioner_summary, patient_summary))
+            os.replace(partial, destination)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return destination
+
+
+def generate_pdf(practitioner_summary, patient_summary):
+    """
+    Return the PDF bytes for the summaries, memoized on their content hash
+    """
+    key = summary_key(practitioner_summary, patient_summary)
+    with _pdf_cache_lock:
+        if key in _pdf_cache:
+            _pdf_cache.move_to_end(key)
+            metrics.increment("pdf_cache_hits")
+            return _pdf_cache[key]
+
+    buffer = BytesIO()
+    write_pdf(practitioner_summary, patient_summary, buffer)
+    data = buffer.getvalue()
+    with _pdf_cache_lock:
+        _pdf_cache[key] = data
+        while len(_pdf_cache) > MAX_CACHED_PDFS:
+            _pdf_cache.popitem(last=False)
+    return data
+
+
+def _evict_pdfs(directory, max_bytes):
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith(".pdf"):
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return
+    recent = time.time() - EVICTION_GRACE_SECONDS
+    for mtime, size, path in sorted(entries):
+        if mtime >= recent:
+            break
+        try:
+            # A reader that already opened the file keeps reading it on POSIX; on
+            # Windows an open file cannot be removed and is left for the next pass
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        if total <= max_bytes:
+            break
+    logging.info(f"🧹 PDF cache trimmed to {total} bytes")
+
+
+def pdf_path(practitioner_summary, patient_summary, directory=DEFAULT_PDF_DIR, max_bytes=DEFAULT_MAX_PDF_DIR_BYTES):
+    """
+    Return the path of a PDF for the summaries under `directory`, named by their
+    content hash and rendered only if it does not exist yet. Suitable for
+    streaming large exports from disk (e.g. as an HTTP file response). The
+    least recently used PDFs are removed once `directory` exceeds `max_bytes`,
+    except those used in the last EVICTION_GRACE_SECONDS.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, summary_key(practitioner_summary, patient_summary) + ".pdf")
+    if os.path.exists(path):
+        metrics.increment("pdf_cache_hits")
+        os.utime(path)
+        return path
+    write_pdf(practitioner_summary, patient_summary, path)
+    _evict_pdfs(directory, max_bytes)
+    return path
+
+
+def _render_one(item):
+    path, practitioner_summary, patient_summary = item
+    return write_pdf(practitioner_summary, patient_summary, path)
+
+
+def render_pdfs(items, output_dir, max_workers=None):
+    """
+    Render many reports' summaries to `output_dir` in worker processes.
+
+    `items` yields (name, practitioner_summary, patient_summary). Each PDF is
+    named after its report and the summaries' content hash, so reruns skip PDFs
+    whose summaries have not changed. Returns (rendered, skipped).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    skipped = 0
+    for name, practitioner_summary, patient_summary in items:
+        stem = re.sub(r"[^\w.-]+", "_", os.path.splitext(os.path.basename(name))[0])
+        key = summary_key(practitioner_summary, patient_summary)[:12]
+        path = os.path.join(output_dir, f"{stem}-{key}.pdf")
+        if os.path.exists(path):
+            skipped += 1
+        else:
+            jobs.append((path, practitioner_summary, patient_summary))
+
+    if jobs:
+        # Same start method as the OCR pool: forking a multithreaded caller can deadlock the child
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(start_method)) as pool:
+            for _ in pool.map(_render_one, jobs, chunksize=8):
+                pass
+    return len(jobs), skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render summaries from a pipeline JSONL file into PDFs.")
+    parser.add_argument("source", help="JSONL written by pipeline.py")
+    parser.add_argument("-o", "--output-dir", required=True, help="Directory for the PDFs")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def items():
+        with open(args.source, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                summaries = record.get("summaries")
+                if summaries:
+                    yield record.get("path") or record["id"], summaries.get("practitioner"), summaries.get("layman")
+
+    rendered, skipped = render_pdfs(items(), args.output_dir, max_workers=args.workers)
+    logging.info(f"📄 Rendered {rendered} PDFs, {skipped} already up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+
+import metrics
+from chunking import chunk_report
+from summarizer import (
+    DEFAULT_REQUESTS_PER_MINUTE,
+    DEFAULT_TOKENS_PER_MINUTE,
+    RateLimiter,
+    summarize_report_for_audiences,
+)
+
+DEFAULT_AUDIENCES = ("practitioner", "layman")
+DEFAULT_STAGE_WORKERS = {"extract": 2, "deidentify": 1, "chunk": 1, "summarize": 2}
+
+_DONE = object()
+
+
+def expand_inputs(patterns):
+    """
+    Resolve files, directories and glob patterns into a sorted, de-duplicated
+    list of supported report paths
+    """
+    from file_loader import SUPPORTED_EXTENSIONS
+
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*")
+        for path in glob.glob(pattern, recursive=True) or [pattern]:
+            if os.path.isfile(path) and path.lower().endswith(SUPPORTED_EXTENSIONS):
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def checkpoint_key(path):
+    """
+    Identify a file by path, size and modification time, so edited files are redone
+    """
+    stat = os.stat(path)
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def load_checkpoint(checkpoint_path):
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def _start_stage(name, fn, inbox, workers):
+    """
+    Run `fn(record)` on records from `inbox` in `workers` threads and return the
+    bounded queue they feed. Failed records carry an "error" and skip later stages.
+    """
+    outbox = queue.Queue(maxsize=2 * workers)
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            record = inbox.get()
+            if record is _DONE:
+                inbox.put(_DONE)
+                with lock:
+                    remaining[0] -= 1
+                    if remaining[0] == 0:
+                        outbox.put(_DONE)
+                return
+            if "error" not in record:
+                try:
+                    with metrics.track(record["metrics"]):
+                        fn(record)
+                except Exception as e:
+                    logging.error(f"❌ {name} failed for {record['id']}: {e}")
+                    record["error"] = f"{name}: {e}"
+            outbox.put(record)
+
+    for i in range(workers):
+        threading.Thread(target=work, name=f"{name}-{i+1}", daemon=True).start()
+    return outbox
+
+
+def iter_pipeline(paths, llm, audiences=DEFAULT_AUDIENCES, derive_layman=False, stage_workers=None,
+                  rate_limiter=None, cache=None, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                  tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, include_text=False):
+    """
+    Run extract -> de-identify -> chunk -> summarize over report files and yield
+    one result dict per file, in completion order.
+
+    Each stage runs in its own pool of threads (sizes from `stage_workers`,
+    defaulting to DEFAULT_STAGE_WORKERS) connected by bounded queues, so a slow
+    stage holds back the ones feeding it instead of buffering whole documents.
+    All summaries share one rate limiter and LLM cache. Failed files are
+    yielded with an "error" field. Each result carries its own stage timings
+    and LLM counters under "metrics".
+    """
+    from deidentification import deidentify_patient_info
+    from file_loader import extract_text_from_path
+
+    workers = {**DEFAULT_STAGE_WORKERS, **(stage_workers or {})}
+    rate_limiter = rate_limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+
+    def extract(record):
+        record["text"] = extract_text_from_path(record["path"])
+
+    def deidentify(record):
+        record["text"] = deidentify_patient_info(record["text"])
+
+    def chunk(record):
+        record["chunks"] = chunk_report(record["text"])
+
+    def summarize(record):
+        record["summaries"] = summarize_report_for_audiences(
+            os.path.basename(record["path"]), record["chunks"], llm, audiences=audiences,
+            derive_layman=derive_layman, rate_limiter=rate_limiter, cache=cache,
+        )
+
+    source = queue.Queue(maxsize=2 * workers["extract"])
+
+    def feed():
+        try:
+            for path in paths:
+                record = {"id": path, "path": path, "metrics": metrics.Metrics()}
+                try:
+                    record["id"] = checkpoint_key(path)
+                except OSError as e:
+                    # Removed or unreadable since the inputs were listed
+                    logging.error(f"❌ Cannot read {path}: {e}")
+                    record["error"] = f"read: {e}"
+                source.put(record)
+        finally:
+            source.put(_DONE)
+
+    threading.Thread(target=feed, name="feed", daemon=True).start()
+    stream = source
+    for name, fn in (("extract", extract), ("deidentify", deidentify), ("chunk", chunk), ("summarize", summarize)):
+        stream = _start_stage(name, fn, stream, workers[name])
+
+    while True:
+        record = stream.get()
+        if record is _DONE:
+            return
+        result = {"id": record["id"], "path": record["path"], "metrics": record["metrics"].to_json()}
+        if "error" in record:
+            result["error"] = record["error"]
+        else:
+            result["chunks"] = len(record["chunks"])
+            result["summaries"] = record["summaries"]
+            if include_text:
+                result["text"] = record["text"]
+        yield result
+
+
+def run_pipeline(inputs, llm, output_path, checkpoint_path=None, **kwargs):
+    """
+    Process report files/globs into `output_path` (JSONL, appended), skipping
+    files already listed in the checkpoint. Returns (succeeded, failed, skipped).
+    """
+    checkpoint_path = checkpoint_path or f"{output_path}.checkpoint"
+    done = load_checkpoint(checkpoint_path)
+    paths = expand_inputs(inputs)
+
+    def pending(path):
+        try:
+            return checkpoint_key(path) not in done
+        except OSError:
+            return True  # reported as a failed record by iter_pipeline
+
+    todo = [path for path in paths if pending(path)]
+    skipped = len(paths) - len(todo)
+    if skipped:
+        logging.info(f"⏭️ Skipping {skipped} reports already in {checkpoint_path}")
+
+    succeeded = failed = 0
+    with open(output_path, "a", encoding="utf-8") as out, open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        for result in iter_pipeline(todo, llm, **kwargs):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            if "error" in result:
+                failed += 1
+                continue
+            # Only successes are checkpointed, so failures are retried on the next run
+            checkpoint.write(result["id"] + "\n")
+            checkpoint.flush()
+            succeeded += 1
+            logging.info(f"📄 Processed {succeeded + failed}/{len(todo)}: {result['path']}")
+    return succeeded, failed, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract, de-identify and summarize report files, writing JSONL.")
+    parser.add_argument("inputs", nargs="+", help="Report files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="Output JSONL path (appended to)")
+    parser.add_argument("--checkpoint", help="Checkpoint file of finished reports (default: <output>.checkpoint)")
+    parser.add_argument("--audiences", nargs="+", default=list(DEFAULT_AUDIENCES), help="Summary audiences")
+    parser.add_argument("--derive-layman", action="store_true", help="Write the layman summary from the practitioner notes")
+    parser.add_argument("--include-text", action="store_true", help="Also write the de-identified text")
+    for stage, count in DEFAULT_STAGE_WORKERS.items():
+        parser.add_argument(f"--{stage}-workers", type=int, default=count, help=f"Concurrent {stage} workers")
+    parser.add_argument("--requests-per-minute", type=int, default=DEFAULT_REQUESTS_PER_MINUTE)
+    parser.add_argument("--tokens-per-minute", type=int, default=DEFAULT_TOKENS_PER_MINUTE)
+    parser.add_argument("--gemini-model", help="Gemini model name")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the on-disk LLM response cache")
+    parser.add_argument("--metrics-out", help="Write run totals here (.prom for Prometheus text, else JSON)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from dotenv import load_dotenv
+    from google.generativeai import configure
+    from gemini_llm import DEFAULT_GEMINI_MODEL, build_gemini_llm
+    from llm_cache import LLMCache
+
+    load_dotenv()
+    configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    llm = build_gemini_llm(args.gemini_model or DEFAULT_GEMINI_MODEL)
+    cache = None if args.no_cache else LLMCache()
+
+    stage_workers = {stage: getattr(args, f"{stage}_workers") for stage in DEFAULT_STAGE_WORKERS}
+    succeeded, failed, skipped = run_pipeline(
+        args.inputs, llm, args.output, checkpoint_path=args.checkpoint, audiences=tuple(args.audiences),
+        derive_layman=args.derive_layman, stage_workers=stage_workers, cache=cache,
+        requests_per_minute=args.requests_per_minute, tokens_per_minute=args.tokens_per_minute,
+        include_text=args.include_text,
+    )
+    logging.info(f"✅ Done: {succeeded} summarized, {failed} failed, {skipped} skipped")
+    if args.metrics_out:
+        metrics.write_metrics(args.metrics_out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import logging
+import math
+import re
+import threading
+from collections import OrderedDict
+
+import metrics
+
+# Only used when semantic matching is turned on; paraphrases can still differ in meaning
+DEFAULT_SIMILARITY_THRESHOLD = 0.97
+DEFAULT_MAX_ENTRIES = 1000
+
+# Words that flip the meaning of otherwise near-identical clinical questions
+_CONTRAST_WORDS = frozenset((
+    "left", "right", "bilateral", "upper", "lower", "with", "without", "no", "not", "any", "none",
+    "before", "after", "pre", "post", "increase", "increased", "decrease", "decreased", "high", "low",
+    "positive", "negative", "acute", "chronic", "new", "old", "current", "previous", "prior", "first", "last",
+))
+
+
+def normalize_question(question):
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip("?!. ")
+
+
+def _guard_terms(normalized):
+    # Numbers and contrast words must agree before a semantic match is served
+    return frozenset(word for word in re.findall(r"[a-z]+|\d+(?:\.\d+)?", normalized)
+                     if word in _CONTRAST_WORDS or word[0].isdigit())
+
+
+def _unit(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class SemanticAnswerCache:
+    """
+    Answers to earlier questions, per document. A question is a hit when it
+    matches an earlier one after normalization. With `semantic=True`, a
+    question is also a hit when the cosine similarity of their embeddings
+    reaches `threshold` and both use the same numbers and contrast words
+    (left/right, with/without, ...). The least recently used answers are
+    dropped past `max_entries` across all documents.
+    """
+
+    def __init__(self, semantic=False, threshold=DEFAULT_SIMILARITY_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES):
+        self.semantic = semantic
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (doc_key, normalized question) -> (unit vector, answer)
+        self._lock = threading.Lock()
+
+    def get(self, doc_key, question, embed=None):
+        """
+        Look up `question` about `doc_key` and return (answer or None, vector).
+        `embed(text)` is only called on a miss by exact match, and the vector it
+        returns is handed back so it can be reused when storing the answer.
+        Without `semantic`, only exact matches are served and `embed` is unused.
+        """
+        exact = (doc_key, normalize_question(question))
+        vector = None
+        with self._lock:
+            best = exact if exact in self._entries else None
+        if best is None and self.semantic and embed is not None:
+            vector = embed(exact[1])
+            unit = _unit(vector)
+            terms = _guard_terms(exact[1])
+            best_score = self.threshold
+            with self._lock:
+                for key, (cached_vector, _) in self._entries.items():
+                    if key[0] != doc_key or cached_vector is None or _guard_terms(key[1]) != terms:
+                        continue
+                    score = sum(a * b for a, b in zip(unit, cached_vector))
+                    if score >= best_score:
+                        best, best_score = key, score
+
+        with self._lock:
+            if best is None or best not in self._entries:
+                self.misses += 1
+                metrics.increment("qa_cache_misses")
+                return None, vector
+            self._entries.move_to_end(best)
+            self.hits += 1
+            metrics.increment("qa_cache_hits")
+            return self._entries[best][1], vector
+
+    def set(self, doc_key, question, vector, answer):
+        with self._lock:
+            key = (doc_key, normalize_question(question))
+            self._entries[key] = (_unit(vector) if vector is not None else None, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+def build_qa_chain(llm, vector_index):
+    """
+    Build the retrieval Q&A chain for one document; reuse it for every question
+    """
+    from langchain.chains import RetrievalQAWithSourcesChain
+
+    return RetrievalQAWithSourcesChain.from_llm(llm=llm, retriever=vector_index.as_retriever())
+
+
+def answer_question(chain, question, doc_key, embeddings, cache=None):
+    """
+    Answer `question` with `chain`, serving repeated or near-identical questions
+    about the same document from `cache`
+    """
+    vector = None
+    if cache is not None:
+        answer, vector = cache.get(doc_key, question, embed=embeddings.embed_query)
+        if answer is not None:
+            logging.info("💬 Answered from the answer cache.")
+            return answer
+
+    with metrics.stage("qa_chain"):
+        answer = chain.invoke({"question": question})["answer"]
+    if cache is not None:
+        cache.set(doc_key, question, vector, answer)
+    return answer
@@ -0,0 +1,438 @@
+"""
+HTTP service exposing extraction, de-identification, indexing, summarization
+and Q&A, for running behind a load balancer instead of Streamlit.
+
+    uvicorn service:app --workers 4
+    MEDSUM_STUB_LLM=1 uvicorn service:app      # no Gemini calls, for tests
+
+Long-running work is submitted as a job (202 + job id) and executed on a
+bounded thread pool; poll GET /jobs/{job_id} for the result. Jobs are kept in
+SQLite so any worker process on the host can answer a poll, and are deleted
+after $JOB_TTL_SECONDS (one hour by default). Extraction results hold text
+that has not been de-identified, so they are deleted as soon as they have
+been polled. spaCy and the embedding model are loaded once per worker
+process, at startup.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse
+from langchain_core.language_models.llms import LLM
+from pydantic import BaseModel
+
+import metrics
+
+DEFAULT_SERVICE_WORKERS = 2
+DEFAULT_INTERACTIVE_WORKERS = 4
+DEFAULT_JOB_TTL_SECONDS = 3600
+# A worker renews the lease on its unfinished jobs every JOB_HEARTBEAT_SECONDS; jobs whose
+# lease runs out (the worker died or restarted) are marked failed by any other worker
+JOB_LEASE_SECONDS = 60
+JOB_HEARTBEAT_SECONDS = 15
+DEFAULT_MAX_PENDING_JOBS = 100
+DEFAULT_JOBS_PATH = os.path.join(".cache", "jobs.sqlite")
+MAX_CACHED_QA_CHAINS = 32
+
+
+class StubLLM(LLM):
+    """
+    Deterministic offline LLM: answers with a short digest of the prompt
+    """
+
+    def _call(self, prompt: str, stop: List[str] = None, **kwargs) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        return f"Stub summary {digest}.\nSOURCES: chunk-1"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": "stub"}
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+
+class JobStore:
+    """
+    Job status and results in SQLite, shared by the worker processes on a host.
+    Each store instance is one lease owner: it must call renew_leases() more
+    often than JOB_LEASE_SECONDS while its jobs are unfinished.
+    """
+
+    def __init__(self, path=None, ttl_seconds=None):
+        self.owner = uuid.uuid4().hex
+        self.path = path or os.getenv("JOBS_PATH") or DEFAULT_JOBS_PATH
+        self.ttl_seconds = ttl_seconds or float(os.getenv("JOB_TTL_SECONDS", DEFAULT_JOB_TTL_SECONDS))
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Overwrite deleted results on disk rather than leaving them in free pages
+        self._conn.execute("PRAGMA secure_delete=ON")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, result TEXT, error TEXT, "
+            "created REAL NOT NULL, updated REAL NOT NULL, lease_owner TEXT, lease_until REAL)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        for column, kind in (("lease_owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.commit()
+
+    def create(self, kind):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, created, updated, lease_owner, lease_until) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, now, now, self.owner, now + JOB_LEASE_SECONDS),
+            )
+            self._conn.commit()
+        return job_id
+
+    def update(self, job_id, status, result=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, result, error, created, updated FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0], "kind": row[1], "status": row[2],
+            "result": json.loads(row[3]) if row[3] else None, "error": row[4],
+            "created": row[5], "updated": row[6],
+        }
+
+    def delete(self, job_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._conn.commit()
+
+    def purge_expired(self):
+        """
+        Delete finished jobs last updated more than `ttl_seconds` ago
+        """
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+            self._conn.commit()
+        if deleted:
+            logging.info(f"🧹 Deleted {deleted} expired jobs.")
+        return deleted
+
+    def renew_leases(self):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE lease_owner = ? AND status IN ('queued', 'running')",
+                (time.time() + JOB_LEASE_SECONDS, self.owner),
+            )
+            self._conn.commit()
+
+    def fail_orphaned(self):
+        """
+        Mark queued or running jobs whose lease has run out (their worker died or restarted) as failed
+        """
+        now = time.time()
+        with self._lock:
+            failed = self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker stopped before the job finished', updated = ? "
+                "WHERE status IN ('queued', 'running') AND (lease_until IS NULL OR lease_until < ?)",
+                (now, now),
+            ).rowcount
+            self._conn.commit()
+        if failed:
+            logging.warning(f"⚠️ Marked {failed} interrupted jobs as failed.")
+        return failed
+
+
+class Worker:
+    """
+    The models, caches and thread pool behind one service process
+    """
+
+    def __init__(self, llm, max_workers=DEFAULT_SERVICE_WORKERS, max_pending=DEFAULT_MAX_PENDING_JOBS, jobs_path=None):
+        from embeddings import get_embedding_service
+        from llm_cache import LLMCache
+        from qa import SemanticAnswerCache
+        from summarizer import RateLimiter
+        from vector_store import VectorIndexStore
+
+        self.llm = llm
+        self.max_pending = max_pending
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+        self.jobs = JobStore(jobs_path)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        # Q&A and PDF requests get their own threads so they are not stuck behind long jobs
+        self.interactive = ThreadPoolExecutor(max_workers=DEFAULT_INTERACTIVE_WORKERS, thread_name_prefix="interactive")
+        self.embeddings = get_embedding_service()
+        self.vector_store = VectorIndexStore()
+        self.llm_cache = LLMCache()
+        self.answer_cache = SemanticAnswerCache()
+        self.rate_limiter = RateLimiter()
+        self._qa_chains = OrderedDict()
+        self._qa_lock = threading.Lock()
+        self._stopped = threading.Event()
+        threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+
+    def _heartbeat(self):
+        # Keeps this worker's jobs leased and cleans up after others, off the request path
+        while True:
+            try:
+                self.jobs.renew_leases()
+                self.jobs.fail_orphaned()
+                self.jobs.purge_expired()
+            except sqlite3.Error as e:
+                logging.error(f"❌ Job store maintenance failed: {e}")
+            if self._stopped.wait(JOB_HEARTBEAT_SECONDS):
+                return
+
+    def stop(self):
+        self._stopped.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.interactive.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self):
+        from deidentification import get_nlp
+
+        get_nlp()
+        self.embeddings.embed_query("warm up")
+
+    def index_document(self, text):
+        from chunking import DEFAULT_CHUNK_TOKENS, chunk_report
+        from langchain_community.vectorstores import FAISS
+        from vector_store import document_key
+
+        chunks = chunk_report(text)
+        doc_key = document_key(text, self.embeddings.model_name, chunking={"sections": DEFAULT_CHUNK_TOKENS})
+        self.vector_store.get_or_build(doc_key, self.embeddings, lambda: FAISS.from_documents(chunks, self.embeddings))
+        return doc_key, chunks
+
+    def summarize(self, text, audiences, derive_layman):
+        from summarizer import summarize_report_for_audiences
+
+        doc_key, chunks = self.index_document(text)
+        summaries = summarize_report_for_audiences(
+            "Medical Report", chunks, self.llm, audiences=tuple(audiences), derive_layman=derive_layman,
+            rate_limiter=self.rate_limiter, cache=self.llm_cache,
+        )
+        return {"doc_key": doc_key, "chunks": len(chunks), "summaries": summaries}
+
+    def process(self, filename, data, audiences, derive_layman):
+        from deidentification import deidentify_patient_info
+        from file_loader import extract_text
+
+        text = deidentify_patient_info(extract_text(filename, data))
+        return {**self.summarize(text, audiences, derive_layman), "text": text}
+
+    def answer(self, doc_key, question):
+        from qa import answer_question, build_qa_chain
+
+        with self._qa_lock:
+            chain = self._qa_chains.get(doc_key)
+            if chain is not None:
+                self._qa_chains.move_to_end(doc_key)
+        if chain is None:
+            vector_index = self.vector_store.get(doc_key, self.embeddings)
+            if vector_index is None:
+                return None
+            chain = build_qa_chain(self.llm, vector_index)
+            with self._qa_lock:
+                self._qa_chains[doc_key] = chain
+                while len(self._qa_chains) > MAX_CACHED_QA_CHAINS:
+                    self._qa_chains.popitem(last=False)
+        return answer_question(chain, question, doc_key, self.embeddings, cache=self.answer_cache)
+
+    def submit(self, kind, fn, *args):
+        """
+        Queue `fn(*args)` as a job and return its id, or raise 503 when too much is queued
+        """
+        with self._pending_lock:
+            if self.pending >= self.max_pending:
+                raise HTTPException(status_code=503, detail="Too many queued jobs, retry later")
+            self.pending += 1
+        try:
+            job_id = self.jobs.create(kind)
+        except Exception:
+            with self._pending_lock:
+                self.pending -= 1
+            raise
+
+        def run():
+            self.jobs.update(job_id, "running")
+            try:
+                with metrics.track() as job_metrics:
+                    result = fn(*args)
+                self.jobs.update(job_id, "done", result={**result, "metrics": job_metrics.to_json()})
+            except Exception as e:
+                logging.error(f"❌ Job {job_id} ({kind}) failed: {e}")
+                self.jobs.update(job_id, "failed", error=str(e))
+            finally:
+                with self._pending_lock:
+                    self.pending -= 1
+
+        self.executor.submit(run)
+        return {"job_id": job_id, "status": "queued"}
+
+
+class TextRequest(BaseModel):
+    text: str
+
+
+class SummarizeRequest(BaseModel):
+    text: str
+    audiences: List[str] = ["practitioner", "layman"]
+    derive_layman: bool = False
+
+
+class QuestionRequest(BaseModel):
+    question: str
+
+
+def _default_llm():
+    if os.getenv("MEDSUM_STUB_LLM"):
+        return StubLLM()
+
+    from dotenv import load_dotenv
+    from google.generativeai import configure
+    from gemini_llm import build_gemini_llm
+
+    load_dotenv()
+    configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    return build_gemini_llm()
+
+
+def create_app(llm=None, max_workers=None, max_pending=DEFAULT_MAX_PENDING_JOBS, jobs_path=None):
+    """
+    Build the FastAPI app. `llm` defaults to Gemini, or StubLLM when
+    $MEDSUM_STUB_LLM is set; the pool size defaults to $SERVICE_WORKERS or 2.
+    """
+    state = {}
+
+    @asynccontextmanager
+    async def lifespan(app):
+        workers = max_workers or int(os.getenv("SERVICE_WORKERS", DEFAULT_SERVICE_WORKERS))
+        worker = Worker(llm or _default_llm(), max_workers=workers, max_pending=max_pending, jobs_path=jobs_path)
+        # Load the models once for this process before taking traffic
+        await asyncio.get_running_loop().run_in_executor(worker.executor, worker.warm_up)
+        state["worker"] = worker
+        yield
+        worker.stop()
+
+    app = FastAPI(title="Medical Report Summarizer", lifespan=lifespan)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "pending_jobs": state["worker"].pending}
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def prometheus_metrics():
+        return metrics.REGISTRY.to_prometheus()
+
+    @app.post("/jobs/extract", status_code=202)
+    async def extract(file: UploadFile = File(...)):
+        from file_loader import extract_text
+
+        data = await file.read()
+        return await run_in_threadpool(state["worker"].submit, "extract", lambda: {"text": extract_text(file.filename, data)})
+
+    # Handlers that only touch the job store are plain functions, so FastAPI runs them off the event loop
+
+    @app.post("/jobs/deidentify", status_code=202)
+    def deidentify(request: TextRequest):
+        from deidentification import deidentify_patient_info
+
+        return state["worker"].submit("deidentify", lambda: {"text": deidentify_patient_info(request.text)})
+
+    @app.post("/jobs/index", status_code=202)
+    def index(request: TextRequest):
+        worker = state["worker"]
+
+        def run():
+            doc_key, chunks = worker.index_document(request.text)
+            return {"doc_key": doc_key, "chunks": len(chunks)}
+
+        return worker.submit("index", run)
+
+    @app.post("/jobs/summarize", status_code=202)
+    def summarize(request: SummarizeRequest):
+        worker = state["worker"]
+        return worker.submit("summarize", worker.summarize, request.text, request.audiences, request.derive_layman)
+
+    @app.post("/jobs/process", status_code=202)
+    async def process(file: UploadFile = File(...), audiences: Optional[str] = Form(None),
+                      derive_layman: bool = Form(False)):
+        worker = state["worker"]
+        data = await file.read()
+        audience_list = audiences.split(",") if audiences else ["practitioner", "layman"]
+        return await run_in_threadpool(
+            worker.submit, "process", worker.process, file.filename, data, audience_list, derive_layman
+        )
+
+    @app.get("/jobs/{job_id}")
+    def job_status(job_id: str):
+        jobs = state["worker"].jobs
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job")
+        if job["kind"] == "extract" and job["status"] == "done":
+            # Raw extracted text may contain PHI; hand it over once, then drop it
+            jobs.delete(job_id)
+        return job
+
+    @app.get("/jobs/{job_id}/pdf")
+    async def job_pdf(job_id: str):
+        from pdf_export import pdf_path
+
+        worker = state["worker"]
+
+        def render():
+            job = worker.jobs.get(job_id)
+            if job is None or job["status"] != "done" or not (job["result"] or {}).get("summaries"):
+                return None
+            summaries = job["result"]["summaries"]
+            # Rendered once per summary content into the on-disk cache, then streamed from the file
+            return pdf_path(summaries.get("practitioner"), summaries.get("layman"))
+
+        path = await asyncio.get_running_loop().run_in_executor(worker.interactive, render)
+        if path is None:
+            raise HTTPException(status_code=404, detail="No finished summaries for this job")
+        return FileResponse(path, media_type="application/pdf", filename=f"medical_summary_{job_id}.pdf")
+
+    @app.post("/documents/{doc_key}/questions")
+    async def ask(doc_key: str, request: QuestionRequest):
+        worker = state["worker"]
+        answer = await asyncio.get_running_loop().run_in_executor(worker.interactive, worker.answer, doc_key, request.question)
+        if answer is None:
+            raise HTTPException(status_code=404, detail="Unknown document; index or summarize it first")
+        return {"doc_key": doc_key, "answer": answer}
+
+    return app
+
+
+app = create_app()
@@ -1,97 +1,502 @@
 import logging
+import queue
+import random
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-def summarize_medical_report(report_title, chunks, llm, audience="practitioner"):
-    chunk_summaries = []
-
-    def build_chunk_prompt(content):
-        if audience == "practitioner":
-            return f"""
-            You are a medical assistant. Analyze the following section of a medical report titled "{report_title}".
-
-            Extract and summarize relevant clinical information:
-            - Chief complaint (if mentioned)
-            - Key observations and findings
-            - Diagnoses or medical impressions
-            - Treatments or procedures
-            - Recommendations or next steps
-
-            Text:
-            {content}
-            """
-        else:
-            return f"""
-            You are explaining part of a medical report titled "{report_title}" to a patient who does not have a medical background.
-
-            Summarize this in simple, clear language. Include:
-            - What the main health concern is
-            - What the doctor found
-            - Any diagnosis or concern
-            - What was done or advised
-            - What to expect next
-
-            Avoid medical jargon and keep it easy to understand.
-
-            Text:
-            {content}
-            """
-
-    def build_combined_prompt(summaries):
-        if audience == "practitioner":
-            return f"""
-            You are a clinical summarization expert. Given the following partial summaries of a medical report titled "{report_title}",
-            write a clear and comprehensive final summary that combines all key information.
-
-            Use bullet points or organized sections. Be concise but include important clinical details.
-
-            Partial summaries:
-            {summaries}
-            """
-        else:
-            return f"""
-            You are summarizing a full medical report titled "{report_title}" for a patient or their family.
-
-            Combine the following parts into one summary written in plain, easy-to-understand language. Avoid complex terms.
-
-            Summarize:
-            - What the health issue is
-            - What doctors found
-            - What condition is suspected or diagnosed
-            - What actions were taken or planned
-            - What happens next
-
-            Partial summaries:
-            {summaries}
-            """
-
-    for i, chunk in enumerate(chunks):
-        prompt = build_chunk_prompt(chunk.page_content)
-        max_retries = 3
-
-        for retry_count in range(max_retries):
-            try:
-                result = llm.invoke(prompt)
-                chunk_summaries.append(result)
-
-                delay = 5
-                logging.info(f"✅ Chunk {i+1}/{len(chunks)} summarized. Waiting {delay}s before next request.")
-                time.sleep(delay)
-                break
-
-            except Exception as e:
-                if "429" in str(e) and retry_count < max_retries - 1:
-                    wait_time = min(20 * (retry_count + 1), 60)
-                    logging.warning(f"⚠️ Rate limit hit on chunk {i+1}, retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-                else:
-                    logging.error(f"❌ Failed to summarize chunk {i+1}: {e}")
-                    chunk_summaries.append(f"[Error summarizing chunk {i+1}]")
+import metrics
+
+# Defaults sized for the Gemini free tier; raise them for paid quotas
+DEFAULT_REQUESTS_PER_MINUTE = 15
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+DEFAULT_MAX_WORKERS = 4
+# Largest combine prompt sent in one call; longer reports are reduced as a tree
+DEFAULT_REDUCE_TOKEN_BUDGET = 30_000
+# Five attempts back off 5, 10, 20 and 40s (about 75s), so a per-minute quota can reset in between
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 5.0
+
+
+# Words, numbers and single punctuation marks, roughly what a BPE tokenizer splits on
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Offline token estimate for budgeting: each word counts one token per four
+    characters and each punctuation mark counts one, which tracks subword
+    tokenizers closely enough for English clinical text.
+    """
+    return max(1, sum((len(piece) + 3) // 4 for piece in _TOKEN_PATTERN.findall(text)))
+
+
+class RateLimiter:
+    """
+    Thread-safe token buckets for requests and tokens per minute.
+
+    Both buckets start full and refill continuously. After a rate-limit error the
+    buckets are emptied, nothing is sent until the server's retry delay (if it
+    gave one) has passed, and the refill rate is halved; it recovers gradually
+    on each successful call.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._scale = 1.0
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute * self._scale / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute * self._scale / 60)
+
+    def acquire(self, tokens):
+        """
+        Block until one request and `tokens` tokens are available, then take them
+        """
+        # A single prompt larger than the whole budget may still go once the bucket is full
+        tokens = min(tokens, self.tokens_per_minute)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    wait = pause
+                elif self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
                     break
+                else:
+                    request_wait = (1 - self._requests) * 60 / (self.requests_per_minute * self._scale)
+                    token_wait = (tokens - self._tokens) * 60 / (self.tokens_per_minute * self._scale)
+                    wait = max(request_wait, token_wait, 0.01)
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            metrics.record_stage("rate_limit_wait", waited)
+
+    def consume(self, tokens):
+        """
+        Charge tokens after the fact (e.g. the response), possibly going into debt
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+
+    def on_rate_limited(self, retry_after=None):
+        """
+        The server rejected a call: its quota is spent, so stop spending ours too
+        """
+        with self._lock:
+            self._refill()
+            self._scale = max(0.1, self._scale / 2)
+            self._requests = min(self._requests, 0.0)
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def on_success(self):
+        with self._lock:
+            self._scale = min(1.0, self._scale + 0.05)
+
+
+def _result_text(result):
+    return result.content if hasattr(result, "content") else result
+
+
+def _backoff_delay(attempt, base=BACKOFF_BASE_SECONDS, cap=60.0):
+    # Exponential backoff with +-20% jitter so concurrent retries do not line up
+    delay = min(cap, base * 2 ** attempt)
+    return delay * random.uniform(0.8, 1.2)
 
-    combined_prompt = build_combined_prompt("\n".join(chunk_summaries))
+
+_RETRY_AFTER_PATTERN = re.compile(r"retry[ _-]?(?:after|in|delay)\D{0,20}?(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+def _retry_after(error):
+    """
+    Seconds the server asked us to wait, from a Retry-After header or the error
+    text (Gemini: "retry_delay { seconds: 23 }"), or None
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("Retry-After") if hasattr(headers, "get") else None
+    if value is None:
+        match = _RETRY_AFTER_PATTERN.search(str(error))
+        value = match.group(1) if match else None
     try:
-        final_result = llm.invoke(combined_prompt)
-        return final_result.content if hasattr(final_result, "content") else final_result
-    except Exception as e:
-        logging.error(f"Error generating final summary: {str(e)}")
-        return f"Error generating final summary: {str(e)}"
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _wait_after_rate_limit(error, attempt, rate_limiter, label):
+    retry_after = _retry_after(error)
+    rate_limiter.on_rate_limited(retry_after)
+    wait_time = max(_backoff_delay(attempt), retry_after or 0)
+    logging.warning(f"⚠️ Rate limit hit on {label}, retrying in {wait_time:.1f}s...")
+    metrics.increment("llm_retries")
+    time.sleep(wait_time)
+    metrics.record_stage("retry_backoff", wait_time)
+
+
+def _call_with_retry(call, prompt, rate_limiter, label, max_retries, retryable=lambda: True):
+    """
+    Run `call()` (one model request for `prompt`, returning its text) under the
+    rate limiter with metrics, retrying 429 errors with backoff while
+    `retryable()` holds
+    """
+    prompt_tokens = estimate_tokens(prompt)
+    for attempt in range(max_retries):
+        rate_limiter.acquire(prompt_tokens)
+        metrics.increment("llm_calls")
+        metrics.increment("prompt_tokens", prompt_tokens)
+        try:
+            with metrics.stage("llm_call"):
+                result = call()
+        except Exception as e:
+            if "429" in str(e) and retryable() and attempt < max_retries - 1:
+                _wait_after_rate_limit(e, attempt, rate_limiter, label)
+                continue
+            metrics.increment("llm_errors")
+            raise
+        response_tokens = estimate_tokens(result)
+        metrics.increment("response_tokens", response_tokens)
+        rate_limiter.on_success()
+        rate_limiter.consume(response_tokens)
+        return result
+
+
+def _cached(cache, llm, prompt, label):
+    if cache is None:
+        return None, None
+    key = cache.key_for(llm, prompt)
+    cached = cache.get(key)
+    if cached is not None:
+        logging.info(f"🗄️ Cache hit for {label}.")
+        metrics.increment("llm_cache_hits")
+    return key, cached
+
+
+def invoke_with_retry(llm, prompt, rate_limiter, label="request", max_retries=MAX_RETRIES, cache=None):
+    """
+    Call llm.invoke under the rate limiter, retrying 429 errors with jittered backoff.
+    With a `cache` (see llm_cache.LLMCache), cached responses skip the model and the limiter.
+    """
+    key, cached = _cached(cache, llm, prompt, label)
+    if cached is not None:
+        return cached
+
+    result = _call_with_retry(lambda: _result_text(llm.invoke(prompt)), prompt, rate_limiter, label, max_retries)
+    if cache is not None:
+        cache.set(key, result)
+    return result
+
+
+def stream_with_retry(llm, prompt, rate_limiter, on_text, label="request", max_retries=MAX_RETRIES, cache=None):
+    """
+    Like invoke_with_retry, but passes each piece of the response to `on_text` as
+    it arrives (via llm.stream when the LLM has it) and returns the full text.
+    A 429 is only retried before any text has been streamed.
+    """
+    key, cached = _cached(cache, llm, prompt, label)
+    if cached is not None:
+        on_text(cached)
+        return cached
+
+    if not hasattr(llm, "stream"):
+        result = invoke_with_retry(llm, prompt, rate_limiter, label=label, max_retries=max_retries)
+        on_text(result)
+    else:
+        pieces = []
+
+        def call():
+            pieces.clear()
+            for piece in llm.stream(prompt):
+                piece = _result_text(piece)
+                pieces.append(piece)
+                on_text(piece)
+            return "".join(pieces)
+
+        result = _call_with_retry(call, prompt, rate_limiter, label, max_retries, retryable=lambda: not pieces)
+
+    if cache is not None:
+        cache.set(key, result)
+    return result
+
+
+def build_chunk_prompt(report_title, content, audience="practitioner"):
+    if audience == "practitioner":
+        return f"""
+        You are a medical assistant. Analyze the following section of a medical report titled "{report_title}".
+
+        Extract and summarize relevant clinical information:
+        - Chief complaint (if mentioned)
+        - Key observations and findings
+        - Diagnoses or medical impressions
+        - Treatments or procedures
+        - Recommendations or next steps
+
+        Text:
+        {content}
+        """
+    else:
+        return f"""
+        You are explaining part of a medical report titled "{report_title}" to a patient who does not have a medical background.
+
+        Summarize this in simple, clear language. Include:
+        - What the main health concern is
+        - What the doctor found
+        - Any diagnosis or concern
+        - What was done or advised
+        - What to expect next
+
+        Avoid medical jargon and keep it easy to understand.
+
+        Text:
+        {content}
+        """
+
+
+def build_combined_prompt(report_title, summaries, audience="practitioner"):
+    if audience == "practitioner":
+        return f"""
+        You are a clinical summarization expert. Given the following partial summaries of a medical report titled "{report_title}",
+        write a clear and comprehensive final summary that combines all key information.
+
+        Use bullet points or organized sections. Be concise but include important clinical details.
+
+        Partial summaries:
+        {summaries}
+        """
+    else:
+        return f"""
+        You are summarizing a full medical report titled "{report_title}" for a patient or their family.
+
+        Combine the following parts into one summary written in plain, easy-to-understand language. Avoid complex terms.
+
+        Summarize:
+        - What the health issue is
+        - What doctors found
+        - What condition is suspected or diagnosed
+        - What actions were taken or planned
+        - What happens next
+
+        Partial summaries:
+        {summaries}
+        """
+
+
+def build_intermediate_prompt(report_title, summaries, audience="practitioner"):
+    if audience == "practitioner":
+        return f"""
+        You are a clinical summarization expert. The following are consecutive partial summaries of part of a medical report titled "{report_title}".
+
+        Merge them into one partial summary. Keep every clinical finding, diagnosis, treatment, value and recommendation, in order, and drop only repetition.
+
+        Partial summaries:
+        {summaries}
+        """
+    else:
+        return f"""
+        The following are consecutive plain-language summaries of part of a medical report titled "{report_title}", written for a patient.
+
+        Merge them into one summary in the same plain, easy-to-understand language. Keep every finding, concern and next step, and drop only repetition.
+
+        Partial summaries:
+        {summaries}
+        """
+
+
+def group_by_token_budget(texts, token_budget, overhead=0):
+    """
+    Split `texts` into consecutive groups whose estimated tokens (plus `overhead`
+    per group) stay within `token_budget`. Always returns fewer groups than texts
+    when there are at least two, so repeated grouping converges.
+    """
+    groups = []
+    current, current_tokens = [], overhead
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > token_budget:
+            groups.append(current)
+            current, current_tokens = [], overhead
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+
+    if len(texts) > 1 and len(groups) >= len(texts):
+        # Every text is over budget on its own; pair them up so the tree still shrinks
+        groups = [list(texts[i:i + 2]) for i in range(0, len(texts), 2)]
+    return groups
+
+
+def summarize_report_for_audiences(report_title, chunks, llm, audiences=("practitioner", "layman"), derive_layman=False,
+                                   max_workers=DEFAULT_MAX_WORKERS, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                                   tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, rate_limiter=None, cache=None,
+                                   reduce_token_budget=DEFAULT_REDUCE_TOKEN_BUDGET, on_event=None):
+    """
+    Summarize a report for several audiences in one run and return {audience: summary}.
+
+    Chunk calls for every audience are interleaved on one thread pool and share
+    one rate-limit budget; the final combine calls then run concurrently too.
+    With derive_layman=True, non-practitioner summaries are combined from the
+    practitioner chunk summaries instead of their own chunk pass, which saves
+    one call per chunk and audience. A `cache` makes unchanged chunks and
+    summaries free on re-runs.
+
+    When the combine prompt would exceed `reduce_token_budget` estimated tokens,
+    the partial summaries are grouped within that budget, each group is merged in
+    parallel, and this repeats until the final combine fits. Pass None to always
+    combine in a single call.
+
+    `on_event`, if given, is called (possibly from worker threads) with progress
+    dicts as the run advances:
+      {"type": "chunk", "audience", "index", "total", "summary"} per chunk summary,
+      {"type": "reduce", "audience", "level", "groups"} per tree-reduce level,
+      {"type": "token", "audience", "text"} per streamed piece of a final summary,
+      {"type": "final", "audience", "summary"} when a final summary is complete.
+    """
+    rate_limiter = rate_limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+    emit = on_event or (lambda event: None)
+    if derive_layman:
+        map_audiences = ["practitioner"]
+    else:
+        map_audiences = list(dict.fromkeys(audiences))
+
+    def summarize_chunk(audience, i, chunk):
+        try:
+            prompt = build_chunk_prompt(report_title, chunk.page_content, audience)
+            summary = invoke_with_retry(llm, prompt, rate_limiter, label=f"{audience} chunk {i+1}", cache=cache)
+            logging.info(f"✅ Chunk {i+1}/{len(chunks)} summarized for {audience}.")
+        except Exception as e:
+            logging.error(f"❌ Failed to summarize chunk {i+1}: {e}")
+            summary = f"[Error summarizing chunk {i+1}]"
+        emit({"type": "chunk", "audience": audience, "index": i, "total": len(chunks), "summary": summary})
+        return summary
+
+    def merge(audience, level, index, group):
+        prompt = build_intermediate_prompt(report_title, "\n".join(group), audience)
+        try:
+            return invoke_with_retry(llm, prompt, rate_limiter, label=f"{audience} reduce level {level} group {index+1}", cache=cache)
+        except Exception as e:
+            logging.error(f"❌ Failed to merge {audience} summaries (level {level}, group {index+1}): {e}")
+            # Keep the unmerged text rather than losing it
+            return "\n".join(group)
+
+    def fits(audience, summaries):
+        if reduce_token_budget is None or len(summaries) <= 1:
+            return True
+        return estimate_tokens(build_combined_prompt(report_title, "\n".join(summaries), audience)) <= reduce_token_budget
+
+    def combine(audience, chunk_summaries):
+        combined_prompt = build_combined_prompt(report_title, "\n".join(chunk_summaries), audience)
+        label = f"{audience} final summary"
+        try:
+            if on_event is None:
+                summary = invoke_with_retry(llm, combined_prompt, rate_limiter, label=label, cache=cache)
+            else:
+                on_text = lambda text: emit({"type": "token", "audience": audience, "text": text})
+                summary = stream_with_retry(llm, combined_prompt, rate_limiter, on_text, label=label, cache=cache)
+        except Exception as e:
+            logging.error(f"Error generating final summary: {str(e)}")
+            summary = f"Error generating final summary: {str(e)}"
+        emit({"type": "final", "audience": audience, "summary": summary})
+        return summary
+
+    # Worker threads record into the caller's tracked metrics too
+    summarize_chunk = metrics.propagate_context(summarize_chunk)
+    merge = metrics.propagate_context(merge)
+    combine = metrics.propagate_context(combine)
+
+    with metrics.stage("summarize"), ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {audience: [] for audience in map_audiences}
+        for i, chunk in enumerate(chunks):
+            for audience in map_audiences:
+                futures[audience].append(executor.submit(summarize_chunk, audience, i, chunk))
+        chunk_summaries = {audience: [f.result() for f in fs] for audience, fs in futures.items()}
+        partials = {
+            audience: chunk_summaries[audience] if audience in chunk_summaries else chunk_summaries["practitioner"]
+            for audience in audiences
+        }
+
+        # Tree reduce, one level at a time across all audiences, until every combine prompt fits
+        level = 0
+        while not all(fits(audience, summaries) for audience, summaries in partials.items()):
+            level += 1
+            level_futures = {}
+            for audience, summaries in partials.items():
+                if fits(audience, summaries):
+                    continue
+                overhead = estimate_tokens(build_intermediate_prompt(report_title, "", audience))
+                groups = group_by_token_budget(summaries, reduce_token_budget, overhead)
+                logging.info(f"🌲 Reducing {len(summaries)} {audience} summaries into {len(groups)} (level {level}).")
+                emit({"type": "reduce", "audience": audience, "level": level, "groups": len(groups)})
+                level_futures[audience] = [executor.submit(merge, audience, level, i, group) for i, group in enumerate(groups)]
+            for audience, fs in level_futures.items():
+                partials[audience] = [f.result() for f in fs]
+
+        final_futures = {audience: executor.submit(combine, audience, partials[audience]) for audience in audiences}
+        return {audience: f.result() for audience, f in final_futures.items()}
+
+
+def summarize_medical_report(report_title, chunks, llm, audience="practitioner", max_workers=DEFAULT_MAX_WORKERS,
+                             requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                             rate_limiter=None, cache=None, reduce_token_budget=DEFAULT_REDUCE_TOKEN_BUDGET,
+                             on_event=None):
+    """
+    Summarize each chunk concurrently (map), then combine the chunk summaries in
+    their original order into one summary (reduce), as a tree if they exceed
+    `reduce_token_budget`. Calls share `rate_limiter`, or a new one built from the
+    per-minute budgets. `on_event` receives progress and streamed tokens as
+    described in summarize_report_for_audiences; see also iter_summary_events.
+    """
+    summaries = summarize_report_for_audiences(
+        report_title, chunks, llm, audiences=(audience,), max_workers=max_workers,
+        requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute, rate_limiter=rate_limiter,
+        cache=cache, reduce_token_budget=reduce_token_budget, on_event=on_event
+    )
+    return summaries[audience]
+
+
+def iter_summary_events(report_title, chunks, llm, audiences=("practitioner", "layman"), **kwargs):
+    """
+    Generator version of summarize_report_for_audiences: runs it in a background
+    thread and yields its progress events in the caller's thread, which is what
+    UI frameworks like Streamlit need. The last event is
+    {"type": "done", "summaries": {audience: summary}}; a failure is re-raised.
+    """
+    events = queue.Queue()
+    outcome = {}
+
+    def run():
+        try:
+            outcome["summaries"] = summarize_report_for_audiences(
+                report_title, chunks, llm, audiences=audiences, on_event=events.put, **kwargs
+            )
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            events.put(None)
+
+    worker = threading.Thread(target=metrics.propagate_context(run), daemon=True)
+    worker.start()
+    while True:
+        event = events.get()
+        if event is None:
+            break
+        yield event
+    worker.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    yield {"type": "done", "summaries": outcome["summaries"]}
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+import metrics
+
+DEFAULT_INDEX_DIR = os.path.join(".cache", "vector_indexes")
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.jsonl"
+
+
+def document_key(text, embedding_model, chunking=None):
+    """
+    Hash a document's text together with everything that shapes its index
+    (embedding model and a JSON-able description of the chunking settings)
+    """
+    payload = json.dumps({"text": text, "model": embedding_model, "chunking": chunking}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def update_index(vector_index, chunks, embeddings):
+    """
+    Bring a LangChain FAISS vector store in line with a new list of chunks, in
+    place: vectors of chunks whose text is unchanged are kept, removed chunks
+    are deleted and only new chunks are embedded and added. Chunk metadata
+    (e.g. "chunk-N" sources) is refreshed for kept chunks too.
+    """
+    import faiss
+
+    # Indexes loaded from the store may be memory-mapped read-only; work on a private copy
+    vector_index.index = faiss.clone_index(vector_index.index)
+
+    existing = {}
+    for doc_id in vector_index.index_to_docstore_id.values():
+        existing.setdefault(vector_index.docstore.search(doc_id).page_content, []).append(doc_id)
+
+    new_chunks = []
+    for chunk in chunks:
+        ids = existing.get(chunk.page_content)
+        if ids:
+            vector_index.docstore.search(ids.pop()).metadata = dict(chunk.metadata)
+        else:
+            new_chunks.append(chunk)
+    stale = [doc_id for ids in existing.values() for doc_id in ids]
+
+    if stale:
+        vector_index.delete(stale)
+    if new_chunks:
+        vectors = embeddings.embed_documents([chunk.page_content for chunk in new_chunks])
+        vector_index.add_embeddings(
+            [(chunk.page_content, vector) for chunk, vector in zip(new_chunks, vectors)],
+            metadatas=[chunk.metadata for chunk in new_chunks],
+        )
+    metrics.increment("chunks_reused", len(chunks) - len(new_chunks))
+    metrics.increment("chunks_added", len(new_chunks))
+    metrics.increment("chunks_removed", len(stale))
+    logging.info(f"🔁 Index updated: {len(chunks) - len(new_chunks)} chunks kept, {len(new_chunks)} added, {len(stale)} removed")
+    return vector_index
+
+
+class VectorIndexStore:
+    """
+    On-disk store of FAISS indexes keyed by document content hash.
+
+    Each entry is a directory holding the raw index written with
+    faiss.write_index and a JSON-lines docstore (one document per vector, in
+    index order). Flat indexes, which FAISS.from_documents builds, are
+    memory-mapped on load with faiss builds that have IO_FLAG_MMAP_IFC; older
+    builds only map IVF inverted lists and read flat indexes fully into
+    memory. The least recently used entries are removed once the store
+    exceeds `max_bytes`.
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path or os.getenv("VECTOR_INDEX_DIR") or DEFAULT_INDEX_DIR
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.path, key)
+
+    def get(self, key, embeddings):
+        """
+        Return a LangChain FAISS vector store for `key`, or None if it is not stored
+        """
+        import faiss
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+        from langchain.schema import Document
+
+        entry = self._entry_dir(key)
+        index_path = os.path.join(entry, INDEX_FILE)
+        docstore_path = os.path.join(entry, DOCSTORE_FILE)
+        with self._lock:
+            if not (os.path.exists(index_path) and os.path.exists(docstore_path)):
+                self.misses += 1
+                return None
+            # IO_FLAG_MMAP alone maps only IVF inverted lists; IO_FLAG_MMAP_IFC also maps flat codes
+            mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+            try:
+                index = faiss.read_index(index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                # Not every index type can be memory-mapped
+                index = faiss.read_index(index_path)
+
+            documents = {}
+            index_to_docstore_id = {}
+            with open(docstore_path, encoding="utf-8") as f:
+                for position, line in enumerate(f):
+                    record = json.loads(line)
+                    documents[record["id"]] = Document(page_content=record["page_content"], metadata=record["metadata"])
+                    index_to_docstore_id[position] = record["id"]
+            os.utime(entry)
+            self.hits += 1
+
+        logging.info(f"📂 Loaded vector index {key[:12]} from disk.")
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=InMemoryDocstore(documents),
+            index_to_docstore_id=index_to_docstore_id,
+        )
+
+    def put(self, key, vector_index):
+        """
+        Persist a LangChain FAISS vector store under `key`
+        """
+        import faiss
+
+        entry = self._entry_dir(key)
+        staging = f"{entry}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(staging, exist_ok=True)
+        faiss.write_index(vector_index.index, os.path.join(staging, INDEX_FILE))
+        with open(os.path.join(staging, DOCSTORE_FILE), "w", encoding="utf-8") as f:
+            for position in range(vector_index.index.ntotal):
+                doc_id = vector_index.index_to_docstore_id[position]
+                doc = vector_index.docstore.search(doc_id)
+                record = {"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        with self._lock:
+            # Another session may have stored the same document meanwhile; keep theirs
+            if os.path.exists(entry):
+                shutil.rmtree(staging, ignore_errors=True)
+            else:
+                os.replace(staging, entry)
+            self._evict()
+
+    def get_or_build(self, key, embeddings, build):
+        """
+        Load the index for `key`, or call `build()` to create and store it
+        """
+        with metrics.stage("index_load"):
+            vector_index = self.get(key, embeddings)
+        if vector_index is None:
+            with metrics.stage("index_build"):
+                vector_index = build()
+                self.put(key, vector_index)
+        else:
+            metrics.increment("index_store_hits")
+        return vector_index
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            entry = os.path.join(self.path, name)
+            if not os.path.isdir(entry) or ".tmp-" in name:
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), size, entry))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        for _, size, entry in sorted(entries):
+            shutil.rmtree(entry, ignore_errors=True)
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+        logging.info(f"🧹 Vector index store trimmed to {total} bytes")
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.makedirs(self.path, exist_ok=True)